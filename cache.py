@@ -0,0 +1,240 @@
+"""
+In-process caches for data which is read much more often than it changes.
+"""
+
+import copy
+import logging
+import os
+import threading
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from typing import Callable
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+# Default limits for staff cache, can be tuned via environment
+STAFF_CACHE_SIZE = int(os.environ.get("STAFF_CACHE_SIZE", 10000))
+STAFF_CACHE_TTL = int(os.environ.get("STAFF_CACHE_TTL", 600))
+# Limits for cache of active projects of PMs
+ACTIVE_PROJECT_CACHE_SIZE = int(os.environ.get("ACTIVE_PROJECT_CACHE_SIZE", 10000))
+ACTIVE_PROJECT_CACHE_TTL = int(os.environ.get("ACTIVE_PROJECT_CACHE_TTL", 3600))
+
+
+class StaffCache:
+    """
+    Read-through cache of staff records.
+    Every record is stored once (under its ObjectId as a string)
+    and also indexed by telegram id and telegram username.
+    Least recently used records are evicted when cache is full
+    and every record expires after time to live (in seconds).
+    Helpers run in a thread pool, so all operations are guarded by a lock.
+    """
+
+    # Fields by which record can be found
+    KEYS = ("_id", "tg_id", "tg_username")
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        self._maxsize = maxsize
+        self._records = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._index = {"tg_id": {}, "tg_username": {}}
+        self._lock = threading.RLock()
+        # Called after record was invalidated, e.g. to tell other instances of bot
+        self.on_invalidate: Callable[[], None] | None = None
+
+    def get(self, key: str, value: ObjectId | str) -> dict | None:
+        """
+        Returns copy of cached record which has given value in given field
+        (one of '_id', 'tg_id', 'tg_username').
+        Returns None if record is not cached (or expired).
+        """
+
+        if not value:
+            return None
+
+        with self._lock:
+            if key == "_id":
+                record = self._records.get(str(value))
+            else:
+                oid = self._index[key].get(value)
+                record = self._records.get(oid) if oid else None
+
+                # Record was evicted or changed since it was indexed
+                if oid and (not record or record.get(key) != value):
+                    del self._index[key][value]
+                    record = None
+
+            # Callers are free to modify what they got
+            return copy.deepcopy(record) if record else None
+
+    def put(self, record: dict) -> None:
+        """
+        Stores staff record (as it came from database) in cache.
+        Records without ObjectId are ignored.
+        """
+
+        if not record or type(record.get("_id")) is not ObjectId:
+            return
+
+        oid = str(record["_id"])
+        with self._lock:
+            self._records[oid] = copy.deepcopy(record)
+            for key in self._index.keys():
+                if record.get(key):
+                    self._index[key][record[key]] = oid
+
+            # Indexes don't know about evictions, so clean them up from time to time
+            if len(self._index["tg_username"]) > 2 * self._maxsize:
+                self._prune()
+
+    def invalidate(
+        self,
+        oid: ObjectId | str = "",
+        tg_id: str = "",
+        tg_username: str = "",
+    ) -> None:
+        """
+        Removes record found by any of given values from cache,
+        so next lookup will read it from database.
+        """
+
+        with self._lock:
+            oids = set()
+            if oid:
+                oids.add(str(oid))
+            if tg_id and tg_id in self._index["tg_id"]:
+                oids.add(self._index["tg_id"].pop(tg_id))
+            if tg_username and tg_username in self._index["tg_username"]:
+                oids.add(self._index["tg_username"].pop(tg_username))
+            for key in oids:
+                self._records.pop(key, None)
+
+        if self.on_invalidate:
+            self.on_invalidate()
+
+    def clear(self) -> None:
+        """Drops all cached records"""
+
+        with self._lock:
+            self._records.clear()
+            for index in self._index.values():
+                index.clear()
+
+    def _prune(self) -> None:
+        """Removes index entries pointing to evicted records"""
+
+        for index in self._index.values():
+            for value in [v for v, oid in index.items() if oid not in self._records]:
+                del index[value]
+
+
+class ActiveProjectCache:
+    """
+    Pointers from PM telegram id to ObjectId of PM's active project.
+    Only ids are kept, project itself is always read from database,
+    so stale pointer costs one extra query, but never returns wrong data.
+    Pointers are also indexed by project, so they could be dropped
+    when only project is known (e.g. it was deleted by other instance of bot).
+    """
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        self._maxsize = maxsize
+        self._pointers = TTLCache(maxsize=maxsize, ttl=ttl)
+        # ObjectId of project -> telegram ids of PMs pointing to it
+        self._projects = {}
+        self._lock = threading.Lock()
+        # Called after pointers were invalidated, e.g. to tell other instances of bot
+        self.on_invalidate: Callable[[], None] | None = None
+
+    def get(self, pm_tg_id: str) -> ObjectId | None:
+        """Returns ObjectId of active project of given PM if it's known"""
+
+        with self._lock:
+            return self._pointers.get(str(pm_tg_id))
+
+    def put(self, pm_tg_id: str, oid: ObjectId | str) -> None:
+        """Remembers active project of given PM"""
+
+        try:
+            oid = ObjectId(oid)
+        except (InvalidId, TypeError):
+            return
+
+        with self._lock:
+            self._unindex(str(pm_tg_id))
+            self._pointers[str(pm_tg_id)] = oid
+            self._projects.setdefault(oid, set()).add(str(pm_tg_id))
+
+            # Index doesn't know about evictions, so clean it up from time to time
+            if len(self._projects) > 2 * self._maxsize:
+                self._prune()
+
+    def invalidate(self, *pm_tg_ids: str) -> None:
+        """
+        Forgets active projects of given PMs.
+        Should be called whenever project becomes active or inactive,
+        changes its PM or is deleted.
+        """
+
+        with self._lock:
+            for pm_tg_id in pm_tg_ids:
+                self._unindex(str(pm_tg_id))
+                self._pointers.pop(str(pm_tg_id), None)
+
+        if self.on_invalidate:
+            self.on_invalidate()
+
+    def invalidate_project(self, oid: ObjectId | str) -> None:
+        """
+        Forgets pointers of all PMs to given project,
+        e.g. when it was deleted or handed over and its PM is not known.
+        """
+
+        try:
+            oid = ObjectId(oid)
+        except (InvalidId, TypeError):
+            return
+
+        with self._lock:
+            for pm_tg_id in self._projects.pop(oid, set()):
+                # Pointer could be evicted or changed since it was indexed
+                if self._pointers.get(pm_tg_id) == oid:
+                    del self._pointers[pm_tg_id]
+
+        if self.on_invalidate:
+            self.on_invalidate()
+
+    def clear(self) -> None:
+        """Forgets all pointers"""
+
+        with self._lock:
+            self._pointers.clear()
+            self._projects.clear()
+
+    def _unindex(self, pm_tg_id: str) -> None:
+        """Removes current pointer of PM from index of projects"""
+
+        oid = self._pointers.get(pm_tg_id)
+        if oid in self._projects:
+            self._projects[oid].discard(pm_tg_id)
+            if not self._projects[oid]:
+                del self._projects[oid]
+
+    def _prune(self) -> None:
+        """Rebuilds index of projects from pointers which are still cached"""
+
+        self._projects = {}
+        for pm_tg_id, oid in self._pointers.items():
+            self._projects.setdefault(oid, set()).add(pm_tg_id)
+
+
+STAFF_CACHE = StaffCache(STAFF_CACHE_SIZE, STAFF_CACHE_TTL)
+ACTIVE_PROJECT_CACHE = ActiveProjectCache(
+    ACTIVE_PROJECT_CACHE_SIZE, ACTIVE_PROJECT_CACHE_TTL
+)
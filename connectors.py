@@ -2,7 +2,7 @@ import json
 import logging
 import re
 
-from helpers import add_worker_info_to_staff, get_worker_oid_from_db_by_tg_username
+from helpers import sync_staff
 from numpy import busday_offset, busday_count, floor, datetime64
 from pathlib import Path
 from pymongo.database import Database
@@ -72,6 +72,8 @@ def load_gan(fp: Path, db: Database) -> list[dict]:
 
     # Adding workers to DB - should be at first place, before proceeding allocations for tasks
     # Check if custom property for telegram was found
+    workers = []
+    staff_ids = {}
     if property_id:
         # If custom property found, then proceed through resources
         for actioner in resources.resource:
@@ -98,15 +100,12 @@ def load_gan(fp: Path, db: Database) -> list[dict]:
                     "INFORM_OF_ALL_PROJECTS": False,
                 },
             }
+            workers.append(worker)
 
-            # Add record to DB and see result
-            try:
-                if not add_worker_info_to_staff(worker, db):
-                    logger.warning(
-                        "Something went wrong while adding worker to staff collection"
-                    )
-            except ValueError as e:
-                logger.error(f"{e}")
+        # Add all workers to DB at once and remember their ids
+        staff_ids = sync_staff(workers, db)
+        if any(worker["tg_username"] not in staff_ids.keys() for worker in workers):
+            logger.warning("Something went wrong while adding workers to staff collection")
 
     # If no custom property for tg_username found then inform developer
     else:
@@ -118,7 +117,9 @@ def load_gan(fp: Path, db: Database) -> list[dict]:
         # Loop through tasks
         for task in obj.project.tasks.task:
             # Build tasks list using recursion
-            tasks.extend(compose_tasks_list(task, allocations, resources, property_id, db))
+            tasks.extend(
+                compose_tasks_list(task, allocations, resources, property_id, staff_ids)
+            )
     else:
         raise AttributeError("There are no tasks in provided file. Nothing to do.")
     return tasks
@@ -181,12 +182,13 @@ def compose_tasks_list(
     allocations: Element,
     resources: Element,
     property_id: str,
-    db: Database,
+    staff_ids: dict[str, str],
 ) -> list:
     """
     Creates tasks list from a task element of .gan file
     and its nested subtasks (if any),
     resources and allocations collections (elements of .gan file too).
+    Ids of actioners are taken from given dictionary (returned by sync_staff).
     Raises AttributeError or ValueError errors if structure is not correct.
     """
 
@@ -204,7 +206,7 @@ def compose_tasks_list(
                     str(allocation["resource-id"]), resources, property_id
                 )
             if tg_username:
-                actioner_id = get_worker_oid_from_db_by_tg_username(tg_username, db)
+                actioner_id = staff_ids.get(tg_username, "")
                 if actioner_id:
                     actioners.append(
                         {
@@ -309,7 +311,9 @@ def compose_tasks_list(
     # Go deeper in subtasks to build tasks list
     if "task" in task:
         for subtask in task.task:
-            subtasks = compose_tasks_list(subtask, allocations, resources, property_id, db)
+            subtasks = compose_tasks_list(
+                subtask, allocations, resources, property_id, staff_ids
+            )
             output_tasks.extend(subtasks)
 
     return output_tasks
@@ -342,7 +346,7 @@ def load_json(fp: Path, db: Database) -> list[dict]:
             and project["tasks"]
             and project["staff"]
         ):
-            # Check staff members for consistency and add to database
+            # Check staff members for consistency and add to database at once
             # (if tg_id or tg_username not present already)
             # And store new oid to same dictionary for later use in actioners of tasks
             staff_keys = [
@@ -358,19 +362,26 @@ def load_json(fp: Path, db: Database) -> list[dict]:
             ]
             for worker in project["staff"]:
                 # Check that provided staff list contains all necessary keys
-                if all(x in staff_keys for x in worker.keys()):
-                    oid = add_worker_info_to_staff(worker, db)
-                    if oid:
-                        worker["new_oid"] = oid
-                    else:
-                        raise ValueError(
-                            "Unable to add following staff member to database:"
-                            f" '{worker}'"
-                        )
-                else:
+                if not all(x in staff_keys for x in worker.keys()):
                     raise AttributeError(
                         f"Member of staff doesn't have all necessary keys ({worker})"
                     )
+            staff_ids = sync_staff(project["staff"], db)
+            missing = []
+            for worker in project["staff"]:
+                # Worker could be given by telegram id or username only
+                oid = staff_ids.get(worker.get("tg_id")) or staff_ids.get(
+                    worker.get("tg_username")
+                )
+                if oid:
+                    worker["new_oid"] = oid
+                else:
+                    missing.append(worker)
+            if missing:
+                raise ValueError(
+                    "Unable to add following staff members to database:"
+                    + "".join(f"\n'{worker}'" for worker in missing)
+                )
 
             # Check each task for presence of keys and values
             # Order of this list matter! See remarks and check below.
@@ -513,6 +524,7 @@ def load_xml(fp: Path, db: Database) -> list[dict]:
         )
 
     # Adding workers to DB - should be at first place, before proceeding allocations for tasks
+    workers = []
     for actioner in resources.Resource:
         # Because collection of resources must contain at least one resource (from docs)
         # seems like MS Project adds one with id=0
@@ -554,16 +566,12 @@ def load_xml(fp: Path, db: Database) -> list[dict]:
                     "INFORM_OF_ALL_PROJECTS": False,
                 },
             }
+            workers.append(worker)
 
-            # Add record to DB and see result
-            try:
-                if not add_worker_info_to_staff(worker, db):
-                    logger.warning(
-                        f"Something went wrong while adding worker {worker} to staff"
-                        " collection"
-                    )
-            except ValueError as e:
-                logger.error(f"{e}")
+    # Add all workers to DB at once and remember their ids
+    staff_ids = sync_staff(workers, db)
+    if any(worker["tg_username"] not in staff_ids.keys() for worker in workers):
+        logger.warning("Something went wrong while adding workers to staff collection")
 
     # Gathering tasks from XML
     if "Tasks" in obj.Project and "Task" in obj.Project.Tasks:
@@ -613,9 +621,7 @@ def load_xml(fp: Path, db: Database) -> list[dict]:
                                     allocation.ResourceUID.cdata, resources, property_id
                                 )
                                 if tg_username:
-                                    actioner_id = get_worker_oid_from_db_by_tg_username(
-                                        tg_username, db
-                                    )
+                                    actioner_id = staff_ids.get(tg_username, "")
                                     if actioner_id:
                                         actioners.append(
                                             {
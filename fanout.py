@@ -0,0 +1,196 @@
+"""
+Concurrent sending of messages of one reminder run.
+Reminders used to await every message in turn, so a project with big team
+and many tasks took minutes to notify. Messages are collected first
+and then sent to different recipients concurrently (up to SEND_CONCURRENCY
+at once), while messages of one recipient keep their order.
+Failure of one message doesn't stop others.
+Messages sent are recorded in delivery ledger, so reminder run repeated
+the same day (after restart of bot or misfire of job) resumes where it stopped
+instead of sending everything again.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+
+from bson import ObjectId
+from datetime import date
+from dotenv import load_dotenv
+from outbox import PRIORITY_BULK
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from repository import forget_delivery, get_deliveries, record_delivery
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+# How many recipients of one reminder run get their messages at the same time
+SEND_CONCURRENCY = int(os.environ.get("SEND_CONCURRENCY", 8))
+
+
+class DeliveryLedger:
+    """
+    Messages of reminder of project delivered on given day (today by default),
+    kept in 'deliveries' collection by project, kind of reminder, date
+    and recipient (see record_delivery). Messages are told by digest of kind
+    of reminder, date and text.
+    Message is recorded right before it's sent: if bot stops in between,
+    message is lost rather than sent twice. If sending fails, record is removed,
+    so next run sends it again. If ledger can't be written, message is sent anyway.
+    """
+
+    def __init__(
+        self, db: Database, project_id: ObjectId | str, kind: str, day: date | None = None
+    ) -> None:
+        self._db = db
+        self._project_id = project_id
+        self._kind = kind
+        self._day = (day or date.today()).isoformat()
+        self._sent = {}
+
+    async def load(self) -> None:
+        """Reads messages already sent by this reminder today with one query"""
+
+        try:
+            self._sent = await get_deliveries(
+                self._project_id, self._kind, self._day, self._db
+            )
+        except PyMongoError as e:
+            logger.error(
+                f"Couldn't read deliveries of '{self._kind}' of project"
+                f" '{self._project_id}': {e}"
+            )
+            self._sent = {}
+
+    def _digest(self, text: str) -> str:
+        return hashlib.sha1(f"{self._kind}:{self._day}:{text}".encode()).hexdigest()
+
+    async def claim(self, chat_id: str, text: str) -> bool:
+        """
+        Records message to recipient as sent and returns True,
+        or returns False if it has been sent already.
+        """
+
+        digest = self._digest(text)
+        sent = self._sent.setdefault(chat_id, set())
+        if digest in sent:
+            return False
+        sent.add(digest)
+        try:
+            await record_delivery(
+                self._project_id, self._kind, self._day, chat_id, digest, self._db
+            )
+        except PyMongoError as e:
+            logger.warning(f"Couldn't record delivery to '{chat_id}': {e}")
+        return True
+
+    async def release(self, chat_id: str, text: str) -> None:
+        """Removes record of message to recipient which wasn't delivered"""
+
+        digest = self._digest(text)
+        self._sent.get(chat_id, set()).discard(digest)
+        try:
+            await forget_delivery(
+                self._project_id, self._kind, self._day, chat_id, digest, self._db
+            )
+        except PyMongoError as e:
+            logger.error(f"Couldn't remove record of failed delivery to '{chat_id}': {e}")
+
+
+class FanOut:
+    """
+    Messages of one reminder run, grouped by recipient.
+    Filled by add(), sent by send(). With delivery ledger
+    messages already sent by previous run of the same day are skipped.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        limit: int = SEND_CONCURRENCY,
+        ledger: DeliveryLedger | None = None,
+    ) -> None:
+        self._bot = bot
+        self._limit = limit
+        self._ledger = ledger
+        self._messages = {}
+
+    def add(self, chat_id: int | str, text: str, **kwargs) -> None:
+        """
+        Remembers message to send (arguments are the same as of send_message).
+        If bot has rate limiter, messages go in its lane for bulk traffic.
+        """
+
+        if getattr(self._bot, "rate_limiter", None):
+            kwargs.setdefault("rate_limit_args", PRIORITY_BULK)
+        self._messages.setdefault(str(chat_id), []).append((text, kwargs))
+
+    async def send(self) -> dict[str, int]:
+        """
+        Sends collected messages and forgets them. Recipients are served
+        concurrently, messages of one recipient go one after another in order
+        they were added. If recipient can't be reached (e.g. blocked the bot),
+        his other messages are skipped. Other errors are logged and sending goes on.
+        Unexpected error (e.g. of ledger) stops messages of its recipient only:
+        they are counted as failed and logged, other recipients get theirs.
+        Returns number of messages 'sent', 'failed', 'skipped' and 'already_sent'
+        (by previous run, according to ledger).
+        """
+
+        messages, self._messages = self._messages, {}
+        result = {"sent": 0, "failed": 0, "skipped": 0, "already_sent": 0}
+        semaphore = asyncio.Semaphore(self._limit)
+        if self._ledger and messages:
+            await self._ledger.load()
+
+        # Number of messages of every recipient handled so far
+        handled = {}
+
+        async def send_to(chat_id: str, queue: list[tuple[str, dict]]) -> None:
+            async with semaphore:
+                for i, (text, kwargs) in enumerate(queue):
+                    handled[chat_id] = i
+                    if self._ledger and not await self._ledger.claim(chat_id, text):
+                        result["already_sent"] += 1
+                        continue
+                    try:
+                        await self._bot.send_message(chat_id, text, **kwargs)
+                    except Exception as e:
+                        # Message wasn't delivered, so next run should send it
+                        if self._ledger:
+                            await self._ledger.release(chat_id, text)
+                        if not isinstance(e, TelegramError):
+                            # Unexpected error stops messages of recipient (see below)
+                            raise
+                        result["failed"] += 1
+                        if isinstance(e, Forbidden) or (
+                            isinstance(e, BadRequest) and "chat not found" in str(e).lower()
+                        ):
+                            logger.warning(f"Can't send messages to '{chat_id}': {e}")
+                            result["skipped"] += len(queue) - i - 1
+                            return
+                        logger.error(f"Couldn't send message to '{chat_id}': {e}")
+                    else:
+                        result["sent"] += 1
+
+        errors = await asyncio.gather(
+            *(send_to(chat_id, queue) for chat_id, queue in messages.items()),
+            return_exceptions=True,
+        )
+        for (chat_id, queue), error in zip(messages.items(), errors):
+            if isinstance(error, Exception):
+                # Message being handled and the rest of recipient's queue
+                result["failed"] += len(queue) - handled.get(chat_id, 0)
+                logger.error(f"Sending messages to '{chat_id}' stopped by error: {error}")
+        if result["failed"]:
+            logger.warning(f"Some messages of reminder weren't delivered: {result}")
+        if result["already_sent"]:
+            logger.info(f"Reminder resumed, messages sent before were skipped: {result}")
+        return result
@@ -0,0 +1,165 @@
+"""
+State of connection to the database.
+Background monitor pings the server from time to time and records
+whether it is reachable and how long the round trip took.
+Handlers check this state instead of pinging the server themselves.
+State also works as a circuit breaker: after several failures in a row
+database calls fail fast until the server answers again.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from datetime import datetime
+from dotenv import load_dotenv
+from pymongo.database import Database
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+# How often monitor pings the server (seconds)
+DB_HEALTH_INTERVAL = int(os.environ.get("DB_HEALTH_INTERVAL", 10))
+# How many failures in a row open the circuit
+DB_FAILURE_THRESHOLD = int(os.environ.get("DB_FAILURE_THRESHOLD", 3))
+# How long calls are refused before one trial call is let through (seconds)
+DB_RESET_TIMEOUT = int(os.environ.get("DB_RESET_TIMEOUT", 30))
+
+# States of circuit breaker
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(ConnectionFailure):
+    """
+    Raised instead of calling the database while circuit is open.
+    It is a ConnectionFailure, so it's handled like any lost connection.
+    """
+
+
+class DBHealth:
+    """
+    Last known state of the database and circuit breaker around it.
+    Updated by monitor and by every call made through the thread pool,
+    which runs in different threads, so all changes are guarded by a lock.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: int) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = CLOSED
+        # Latency of last successful ping in milliseconds
+        self.latency = None
+        self.last_check = None
+        self.last_error = ""
+
+    @property
+    def available(self) -> bool:
+        """
+        Cheap check used by handlers: False only when circuit is open,
+        i.e. database failed several times in a row and didn't recover yet.
+        """
+        return self._state != OPEN
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Tells if database call could be made right now.
+        When circuit is open and reset timeout passed,
+        lets one trial call through (half-open state). Other calls are rejected
+        until result of trial is recorded, or until reset timeout passes again
+        (if trial didn't report, e.g. failed with other error), then next trial goes.
+        """
+
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if time.monotonic() - self._opened_at >= self._reset_timeout:
+                # Restart timer, so only one trial call goes through
+                self._opened_at = time.monotonic()
+                if self._state == OPEN:
+                    logger.info("Trying database again after failures")
+                self._state = HALF_OPEN
+                return True
+            return False
+
+    def check(self, db: Database) -> bool:
+        """
+        Pings the server (blocking) and records result.
+        Returns True if server answered.
+        """
+
+        start = time.perf_counter()
+        try:
+            db.command("ping")
+        except (AttributeError, PyMongoError) as e:
+            self.record_failure(e)
+            return False
+        else:
+            self.record_success((time.perf_counter() - start) * 1000)
+            return True
+        finally:
+            self.last_check = datetime.now()
+
+    def record_failure(self, error: Exception) -> None:
+        """Counts failed call and opens circuit if there were too many of them"""
+
+        with self._lock:
+            self._failures += 1
+            self.last_error = str(error)
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self._failure_threshold
+            ):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                logger.error(
+                    f"Database is unavailable after {self._failures} failures: {error}"
+                )
+
+    def mark_unavailable(self, error: Exception) -> None:
+        """
+        Opens circuit right away, e.g. when database is unreachable at start.
+        Monitor closes it as soon as server answers.
+        """
+
+        with self._lock:
+            self._failures = max(self._failures, self._failure_threshold)
+            self.last_error = str(error)
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    def record_success(self, latency: float | None = None) -> None:
+        """Closes circuit after successful call and stores latency if it was measured"""
+
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Database is available again")
+            self._state = CLOSED
+            self._failures = 0
+            self.last_error = ""
+            if latency is not None:
+                self.latency = latency
+
+    def status(self) -> dict:
+        """Returns snapshot of state for logging and diagnostics"""
+
+        return {
+            "state": self._state,
+            "available": self.available,
+            "latency_ms": round(self.latency, 1) if self.latency is not None else None,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
+
+
+DB_HEALTH = DBHealth(DB_FAILURE_THRESHOLD, DB_RESET_TIMEOUT)
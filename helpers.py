@@ -5,24 +5,317 @@ Some helper functions to help main functions to manupulate with data
 import logging
 import pymongo
 import os
+import zlib
 
+from apscheduler.schedulers.base import BaseScheduler
 from bson import ObjectId
-from datetime import date
+from bson.errors import InvalidId
+from cache import ACTIVE_PROJECT_CACHE, STAFF_CACHE
+from datetime import date, datetime, time, timedelta, timezone
 from dotenv import load_dotenv
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, PyMongoError
+from health import DB_HEALTH
+from pymongo.errors import (
+    BulkWriteError,
+    ConnectionFailure,
+    DuplicateKeyError,
+    PyMongoError,
+    ServerSelectionTimeoutError,
+)
 from pymongo.database import Database
+from pymongo.read_preferences import Nearest, PrimaryPreferred, Secondary, SecondaryPreferred
 from re import sub
 from telegram import InlineKeyboardMarkup, User, InlineKeyboardButton
-from telegram.ext import ContextTypes
-from typing import Tuple
+from telegram.constants import InlineKeyboardMarkupLimit, MessageLimit
+from typing import Callable, Iterable, Tuple
 from urllib.parse import quote_plus
 
+# Settings below could be given in .env file as well
+load_dotenv()
+
 # Callback data for settings menu
 ONE, TWO, THREE = range(3)
 
+# Name of database used by the bot
+DB_NAME = os.environ.get("DB_NAME", "database")
+
+# Read preference for helpers which only read data (see for_reads):
+# 'primary' (default), 'primaryPreferred', 'secondary', 'secondaryPreferred' or 'nearest'.
+# E.g. 'secondaryPreferred' lets secondaries of replica set serve reminders and /status.
+# Max staleness (in seconds, 90 at least) bounds how old data on secondary could be.
+READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+MAX_STALENESS = int(os.environ.get("MONGO_MAX_STALENESS_S", -1))
+READ_PREFERENCES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Where tasks of projects are stored:
+# 'embedded' - as array inside project document (default),
+# 'collection' - in 'tasks' collection, one document per task
+# (keyed by ObjectId of project and id of task), for big schedules.
+TASKS_STORAGE = os.environ.get("TASKS_STORAGE", "embedded")
+TASKS_IN_COLLECTION = TASKS_STORAGE == "collection"
+
+# Kinds of reports for which tasks are selected by database (see get_tasks_to_report)
+REPORT_DAY_BEFORE = "day_before"
+REPORT_STATUS = "status"
+
+# Dates of next events are kept in 'next_events' field of project, so reminders
+# skip idle days without loading tasks (see get_next_events). They are calculated
+# from these fields of tasks.
+NEXT_EVENTS_FIELDS = ["startdate", "enddate", "complete", "milestone", "include"]
+
+# Compact report packs status of many tasks in one message with a button per task,
+# buttons are labeled with id and beginning of name of task (this many characters)
+# and placed in rows of REPORT_BUTTONS_PER_ROW
+REPORT_BUTTON_LABEL = int(os.environ.get("REPORT_BUTTON_LABEL", 24))
+REPORT_BUTTONS_PER_ROW = min(
+    int(os.environ.get("REPORT_BUTTONS_PER_ROW", 2)),
+    InlineKeyboardMarkupLimit.BUTTONS_PER_ROW,
+)
+
+# Users seen in group chats are not checked against staff collection again
+# for this time (seconds), see enrich_staff
+KNOWN_USERS_TTL = int(os.environ.get("KNOWN_USERS_TTL", 7 * 24 * 3600))
+
+# Messages of reminder runs already sent (see record_delivery) are remembered
+# for this time (seconds), so run repeated the same day doesn't send them again
+DELIVERIES_TTL = int(os.environ.get("DELIVERIES_TTL", 3 * 24 * 3600))
+
+# Every write to project increments its 'revision', writes which depend on
+# what was read are made only if revision didn't change (see modify_project).
+# On conflict with concurrent write they are retried this many times.
+REVISION_RETRIES = int(os.environ.get("REVISION_RETRIES", 3))
+
+# Roles of staff in projects kept in participation index (see index_participation)
+ROLE_ACTIONER = "actioner"
+ROLE_PM = "pm"
+
+# Reminders of projects: default time and days of week for every kind.
+# Settings of reminders are kept in 'reminders' field of project, and minutes
+# of week when they are due - in indexed 'reminder_slots' field, which is queried
+# by dispatcher every minute (see get_due_reminders).
+DAYS_OF_WEEK = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+MORNING = "10:00"
+ONTHEEVE = "16:00"
+FRIDAY = "15:00"
+REMINDER_DEFAULTS = {
+    "day_before_update": (ONTHEEVE, DAYS_OF_WEEK),
+    "morning_update": (MORNING, DAYS_OF_WEEK),
+    "friday_update": (FRIDAY, ["fri"]),
+}
+# Minutes missed by dispatcher (e.g. while bot was restarting) are caught up
+# if they are not older than this (minutes)
+REMINDER_CATCH_UP = int(os.environ.get("REMINDER_CATCH_UP", 5))
+# Document in 'meta' collection which holds last minute handled by dispatcher
+DISPATCH_ID = "reminder_dispatch"
+# Reminders of projects set to the same time are spread over this many minutes
+# (e.g. 10:00 reminders are sent from 10:00 to 10:14), so they don't all hit
+# database and Telegram at once. Offset of project within window is derived
+# from its id, so it gets reminders at the same time every day (see get_reminder_offset).
+# Window used for slots is kept in 'reminder_spread' field of project.
+REMINDER_SPREAD = max(int(os.environ.get("REMINDER_SPREAD", 15)), 1)
+MINUTES_OF_WEEK = len(DAYS_OF_WEEK) * 24 * 60
+
+# Indexes needed by queries of the bot: collection, keys and options of index.
+# Telegram id and username are empty for workers who haven't contacted the bot yet,
+# so their uniqueness is checked only for filled values.
+INDEXES = [
+    (
+        "staff",
+        [("tg_username", pymongo.ASCENDING)],
+        {
+            "name": "tg_username",
+            "unique": True,
+            "partialFilterExpression": {"tg_username": {"$gt": ""}},
+        },
+    ),
+    (
+        "staff",
+        [("tg_id", pymongo.ASCENDING)],
+        {
+            "name": "tg_id",
+            "unique": True,
+            "partialFilterExpression": {"tg_id": {"$gt": ""}},
+        },
+    ),
+    (
+        "projects",
+        [("pm_tg_id", pymongo.ASCENDING), ("title", pymongo.ASCENDING)],
+        {"name": "pm_tg_id_title", "unique": True},
+    ),
+    (
+        "projects",
+        [("pm_tg_id", pymongo.ASCENDING), ("active", pymongo.ASCENDING)],
+        {"name": "pm_tg_id_active"},
+    ),
+    (
+        "projects",
+        [("tasks.actioners.actioner_id", pymongo.ASCENDING)],
+        {"name": "tasks_actioners_actioner_id"},
+    ),
+    (
+        "projects",
+        [("reminder_slots.at", pymongo.ASCENDING)],
+        {"name": "reminder_slots_at"},
+    ),
+    (
+        "participation",
+        [("staff_id", pymongo.ASCENDING), ("project_id", pymongo.ASCENDING)],
+        {"name": "staff_id_project_id", "unique": True},
+    ),
+    (
+        "participation",
+        [("project_id", pymongo.ASCENDING)],
+        {"name": "project_id"},
+    ),
+    (
+        "known_users",
+        [("seen", pymongo.ASCENDING)],
+        {"name": "seen", "expireAfterSeconds": KNOWN_USERS_TTL},
+    ),
+    (
+        "deliveries",
+        [
+            ("project_id", pymongo.ASCENDING),
+            ("kind", pymongo.ASCENDING),
+            ("date", pymongo.ASCENDING),
+            ("recipient", pymongo.ASCENDING),
+        ],
+        {"name": "project_id_kind_date_recipient", "unique": True},
+    ),
+    (
+        "deliveries",
+        [("created", pymongo.ASCENDING)],
+        {"name": "created", "expireAfterSeconds": DELIVERIES_TTL},
+    ),
+]
+
+# Indexes for tasks stored in their own collection
+TASK_INDEXES = [
+    (
+        "tasks",
+        [("project_id", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+        {"name": "project_id_id", "unique": True},
+    ),
+    (
+        "tasks",
+        [("project_id", pymongo.ASCENDING), ("startdate", pymongo.ASCENDING)],
+        {"name": "project_id_startdate"},
+    ),
+    (
+        "tasks",
+        [("project_id", pymongo.ASCENDING), ("enddate", pymongo.ASCENDING)],
+        {"name": "project_id_enddate"},
+    ),
+    (
+        "tasks",
+        [("project_id", pymongo.ASCENDING), ("complete", pymongo.ASCENDING)],
+        {"name": "project_id_complete"},
+    ),
+    (
+        "tasks",
+        [("actioners.actioner_id", pymongo.ASCENDING)],
+        {"name": "actioners_actioner_id"},
+    ),
+]
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Settings of reads are checked once on import, wrong ones fall back to defaults
+if READ_PREFERENCE != "primary" and READ_PREFERENCE not in READ_PREFERENCES.keys():
+    logger.error(f"Unknown read preference '{READ_PREFERENCE}', primary is used")
+    READ_PREFERENCE = "primary"
+if MAX_STALENESS != -1 and MAX_STALENESS < 90:
+    logger.error(f"Max staleness {MAX_STALENESS} s is less than 90 s, it's not limited")
+    MAX_STALENESS = -1
+
+
+def activate_project(project_id: ObjectId | str, pm_tg_id: str, db: Database) -> dict:
+    """
+    Makes given project of PM active and other projects of PM inactive.
+    Every project is changed through modify_project, so change made by other
+    session in between (e.g. transfer to other PM) is not overwritten.
+    Concurrent activations could still leave PM with none or several active
+    projects, so active project is resolved by get_active_project at the end.
+    Returns active project of PM (without tasks): it's not the given one
+    if project doesn't belong to PM anymore or other one was activated meanwhile.
+    Returns empty dictionary if PM has no projects.
+    """
+
+    prj_oid = ObjectId(project_id)
+    projection = {"pm_tg_id": 1, "active": 1}
+    activated = modify_project(
+        prj_oid,
+        lambda project: (
+            {"$set": {"active": True}}
+            if project.get("pm_tg_id") == pm_tg_id and not project.get("active")
+            else None
+        ),
+        db,
+        projection,
+    )
+    if activated and activated.get("pm_tg_id") == pm_tg_id:
+        for other in list(
+            db.projects.find(
+                {"pm_tg_id": pm_tg_id, "active": True, "_id": {"$ne": prj_oid}}, {"_id": 1}
+            )
+        ):
+            modify_project(
+                other["_id"],
+                lambda project: (
+                    {"$set": {"active": False}}
+                    if project.get("pm_tg_id") == pm_tg_id and project.get("active")
+                    else None
+                ),
+                db,
+                projection,
+            )
+
+    ACTIVE_PROJECT_CACHE.invalidate(pm_tg_id)
+    return get_active_project(pm_tg_id, db)
+
+
+def add_project(project: dict, db: Database) -> ObjectId | None:
+    """
+    Saves new project to DB. Depending on TASKS_STORAGE tasks are saved
+    inside project document or in 'tasks' collection.
+    Dates of next events of project are calculated (see get_next_events).
+    Returns ObjectId of added project or None if something went wrong.
+    """
+
+    # Id is needed beforehand to spread reminders of project
+    prj_oid = project.get("_id") or ObjectId()
+    document = dict(
+        project,
+        _id=prj_oid,
+        revision=0,
+        reminder_slots=get_reminder_slots(
+            project.get("reminders") or {}, get_reminder_offset(prj_oid)
+        ),
+        reminder_spread=REMINDER_SPREAD,
+        next_events=get_next_events(project.get("tasks", [])),
+    )
+    if TASKS_IN_COLLECTION:
+        document["tasks"] = []
+        document["tasks_in_collection"] = True
+
+    try:
+        prj_oid = db.projects.insert_one(document).inserted_id
+        if TASKS_IN_COLLECTION and project.get("tasks"):
+            # Participation index is updated there too
+            save_tasks(prj_oid, project["tasks"], db)
+        else:
+            index_participation(prj_oid, db, project.get("tasks", []))
+    except PyMongoError as e:
+        logger.error(f"Error adding project '{project.get('title')}' to DB: {e}")
+        prj_oid = None
+
+    return prj_oid
+
 
 def add_user_id_to_db(user: User, db: Database) -> ObjectId | None:
     """
@@ -47,6 +340,7 @@ def add_user_id_to_db(user: User, db: Database) -> ObjectId | None:
         result = db.staff.update_one(
             {"tg_username": user.username}, {"$set": {"tg_id": str(user.id)}}
         )
+        STAFF_CACHE.invalidate(oid=record["_id"], tg_username=user.username)
         if result.modified_count > 0 and type(record["_id"]) is ObjectId:
             output = record["_id"]
 
@@ -86,6 +380,7 @@ def add_user_info_to_db(user: User, db: Database) -> ObjectId | None:
             result = db.staff.update_one(
                 {"tg_username": user.username}, {"$set": dict2update}
             )
+            STAFF_CACHE.invalidate(oid=db_user["_id"], tg_username=user.username)
             if result.modified_count > 0 and type(db_user["_id"]) is ObjectId:
                 output = db_user["_id"]
     return output
@@ -132,6 +427,11 @@ def add_worker_info_to_staff(worker: dict, db: Database) -> str:
             result = db.staff.replace_one(
                 {"_id": ObjectId(worker_id)}, replacement=db_worker
             )
+            STAFF_CACHE.invalidate(
+                oid=worker_id,
+                tg_id=db_worker["tg_id"],
+                tg_username=db_worker["tg_username"],
+            )
             logger.debug(
                 f"Results of worker {db_worker['tg_username']} update:"
                 f" '{result.matched_count}' found, '{result.modified_count}' modified."
@@ -140,6 +440,116 @@ def add_worker_info_to_staff(worker: dict, db: Database) -> str:
     return str(worker_id)
 
 
+def attach_tasks(
+    projects: list[dict], db: Database, projection: dict | None = None
+) -> list[dict]:
+    """
+    Fills 'tasks' of given projects from 'tasks' collection
+    (when TASKS_STORAGE is 'collection') with one query for all projects.
+    Projection limits fields of tasks to load.
+    Projects which still have tasks inside document (saved before storage
+    was switched) are left as is, as well as all projects in 'embedded' mode.
+    Returns the same list.
+    """
+
+    if not TASKS_IN_COLLECTION:
+        return projects
+
+    to_fill = {
+        str(project["_id"]): project
+        for project in projects
+        if project and type(project) is dict and "_id" in project.keys()
+        and not project.get("tasks")
+    }
+    if not to_fill:
+        return projects
+
+    if projection:
+        projection = dict(projection, project_id=1, id=1)
+    else:
+        projection = {"_id": 0}
+    for project in to_fill.values():
+        project["tasks"] = []
+    cursor = db.tasks.find(
+        {"project_id": {"$in": [ObjectId(oid) for oid in to_fill.keys()]}}, projection
+    ).sort([("project_id", pymongo.ASCENDING), ("id", pymongo.ASCENDING)])
+    for task in cursor:
+        task.pop("_id", None)
+        to_fill[str(task.pop("project_id"))]["tasks"].append(task)
+
+    return projects
+
+
+def build_participation(db: Database) -> int:
+    """
+    Fills participation index for projects saved before it existed.
+    Does nothing if index already has entries, so it's safe to call on every start.
+    Returns number of indexed projects.
+    """
+
+    if db.participation.find_one({}, {"_id": 1}):
+        return 0
+
+    count = 0
+    for project in db.projects.find({}, {"_id": 1}):
+        index_participation(project["_id"], db)
+        count += 1
+
+    if count:
+        logger.info(f"Participation index built for {count} projects")
+    return count
+
+
+def claim_reminder_minutes(now: datetime, db: Database) -> list[datetime]:
+    """
+    Returns minutes (local wall clock, naive) which dispatcher of reminders
+    should handle at given moment: this one and ones missed since last handled
+    minute. Last handled minute is kept in 'meta' collection, so minutes missed
+    while bot was restarting are caught up too, and when several instances of bot
+    share database, only one of them gets the minute.
+    Given moment should be timezone-aware (naive one is taken as local time).
+    Wall clock minutes are claimed only forward, so when clock is set back
+    (end of daylight saving time) repeated minutes are not handled twice,
+    and minutes skipped when clock is set forward are caught up.
+    Missed minutes older than REMINDER_CATCH_UP minutes of real time are dropped
+    with a warning. Returns empty list if minute was already handled.
+    """
+
+    if now.tzinfo is None:
+        now = now.astimezone()
+    wall = now.replace(tzinfo=None, second=0, microsecond=0)
+    real = now.astimezone(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+    previous = db.meta.find_one_and_update(
+        {"_id": DISPATCH_ID, "minute": {"$lt": wall}},
+        {"$set": {"minute": wall, "utc": real}},
+        return_document=pymongo.ReturnDocument.BEFORE,
+    )
+    if not previous:
+        # Either dispatcher runs first time or minute is taken already
+        try:
+            db.meta.insert_one({"_id": DISPATCH_ID, "minute": wall, "utc": real})
+        except DuplicateKeyError:
+            return []
+        return [wall]
+
+    minute = timedelta(minutes=1)
+    minutes = [
+        previous["minute"] + minute * i
+        for i in range(1, (wall - previous["minute"]) // minute + 1)
+    ]
+    # Real time passed could differ from wall clock one when clock was moved
+    missed = len(minutes) - 1
+    if previous.get("utc"):
+        missed = min(missed, (real - previous["utc"]) // minute - 1)
+    dropped = minutes[:max(missed - REMINDER_CATCH_UP, 0)]
+    if dropped:
+        logger.warning(
+            f"Reminders of {len(dropped)} missed minutes are dropped (older than"
+            f" {REMINDER_CATCH_UP} minutes): {', '.join(f'{m:%Y-%m-%d %H:%M}' for m in dropped)}"
+        )
+    return minutes[len(dropped):]
+
+
 def clean_project_title(user_input: str) -> str:
     """
     Clean title typed by user from unnecessary spaces and so on.
@@ -159,6 +569,325 @@ def clean_project_title(user_input: str) -> str:
     return title[:max_title_len]
 
 
+def complete_task(project_id: ObjectId | str, task_id: int, db: Database) -> dict:
+    """
+    Sets completeness of given task of given project to 100%.
+    Only the task itself is updated and returned (without project).
+    Dates of next events of project are recalculated (see refresh_next_events).
+    Returns empty dictionary if task was not found.
+    """
+
+    task = None
+    projection = {"_id": 0, "project_id": 0}
+    if TASKS_IN_COLLECTION:
+        task = db.tasks.find_one_and_update(
+            {"project_id": ObjectId(project_id), "id": task_id},
+            {"$set": {"complete": 100}},
+            projection=projection,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if task:
+            db.projects.update_one(
+                {"_id": ObjectId(project_id)}, {"$inc": {"revision": 1}}
+            )
+
+    # Tasks stored in project document (by default or before storage was switched)
+    if not task:
+        project = db.projects.find_one_and_update(
+            # search for project is here (only if it has such task)
+            {"_id": ObjectId(project_id), "tasks.id": task_id},
+            {"$set": {"tasks.$[elem].complete": 100}, "$inc": {"revision": 1}},
+            # Below we choose which element of array to update
+            array_filters=[{"elem.id": task_id}],
+            return_document=pymongo.ReturnDocument.AFTER,
+            # Below we set which fields of document to show
+            projection={
+                "tasks": {
+                    # and select first and only element of array which satisfy condition
+                    "$elemMatch": {"id": task_id}
+                },
+            },
+        )
+        if project and "tasks" in project.keys() and project["tasks"]:
+            task = project["tasks"][0]
+
+    if task:
+        refresh_next_events(project_id, db)
+
+    return task if task and type(task) is dict else {}
+
+
+def delete_participation(project_ids: Iterable[ObjectId | str], db: Database) -> None:
+    """Removes given projects from participation index (on deletion of projects)"""
+
+    oids = [ObjectId(oid) for oid in project_ids]
+    if oids:
+        db.participation.delete_many({"project_id": {"$in": oids}})
+
+
+def delete_tasks(project_ids: Iterable[ObjectId | str], db: Database) -> None:
+    """
+    Deletes tasks of given projects from 'tasks' collection
+    (they are deleted together with projects in 'embedded' mode).
+    """
+
+    if TASKS_IN_COLLECTION:
+        oids = [ObjectId(oid) for oid in project_ids]
+        if oids:
+            db.tasks.delete_many({"project_id": {"$in": oids}})
+
+
+def diff_tasks(stored: list[dict], tasks: list[dict]) -> dict:
+    """
+    Compares tasks of project stored in DB with new ones (e.g. from uploaded file)
+    by task id. Completeness set in bot (with "Mark as completed" button) is kept
+    if new value is lower.
+    Returns dictionary of changes: 'inserted' (new tasks), 'deleted' (ids of tasks
+    absent in new list), 'updated' (changed fields by task id) and 'kept_complete'
+    (ids of tasks whose completeness was kept).
+    """
+
+    old = {task["id"]: task for task in stored}
+    new_ids = set()
+    changes = {"inserted": [], "deleted": [], "updated": {}, "kept_complete": []}
+    for task in tasks:
+        new_ids.add(task["id"])
+        current = old.get(task["id"])
+        if current is None:
+            changes["inserted"].append(task)
+            continue
+
+        fields = {
+            key: value
+            for key, value in task.items()
+            if key not in ("_id", "project_id") and current.get(key) != value
+        }
+        if "complete" in fields.keys() and (current.get("complete") or 0) > (
+            fields["complete"] or 0
+        ):
+            del fields["complete"]
+            changes["kept_complete"].append(task["id"])
+        if fields:
+            changes["updated"][task["id"]] = fields
+
+    changes["deleted"] = [task_id for task_id in old.keys() if task_id not in new_ids]
+    return changes
+
+
+def enrich_staff(users: list[dict], db: Database) -> Tuple[int, list[str]]:
+    """
+    Adds missing info (telegram id and name) to staff records of given users
+    (dictionaries with 'tg_id', 'tg_username' and 'name') seen in group chats.
+    Users which were seen recently (they are kept in 'known_users' collection
+    for KNOWN_USERS_TTL) are skipped, others are updated with one bulk operation,
+    which touches only records with empty fields.
+    Only users whose staff records are complete are remembered: ones without
+    record (e.g. not imported yet) are checked again next time they are seen.
+    Returns number of updated staff records and telegram ids of remembered users.
+    """
+
+    users = [user for user in users if user.get("tg_id") and user.get("tg_username")]
+    if not users:
+        return 0, []
+
+    known = {
+        record["_id"]
+        for record in db.known_users.find(
+            {"_id": {"$in": [user["tg_id"] for user in users]}}, {"_id": 1}
+        )
+    }
+    users = [user for user in users if user["tg_id"] not in known]
+    if not users:
+        return 0, list(known)
+
+    requests = []
+    for user in users:
+        # Keep value of field if filled, otherwise take one from telegram
+        fill_empty = {
+            key: {
+                "$cond": [
+                    {"$in": [{"$ifNull": [f"${key}", ""]}, [""]]},
+                    {"$literal": user[key]},
+                    f"${key}",
+                ]
+            }
+            for key in ("tg_id", "name")
+            if user.get(key)
+        }
+        requests.append(
+            pymongo.UpdateOne(
+                {
+                    "tg_username": user["tg_username"],
+                    "$or": [{"tg_id": {"$in": ["", None]}}, {"name": {"$in": ["", None]}}],
+                },
+                [{"$set": fill_empty}],
+            )
+        )
+    result = db.staff.bulk_write(requests, ordered=False)
+    if result.modified_count > 0:
+        for user in users:
+            STAFF_CACHE.invalidate(tg_username=user["tg_username"])
+
+    # Remember users with complete records, so they are not checked again
+    # for a while (even after restart)
+    complete = {
+        record["tg_username"]
+        for record in db.staff.find(
+            {
+                "tg_username": {"$in": [user["tg_username"] for user in users]},
+                "tg_id": {"$nin": ["", None]},
+                "name": {"$nin": ["", None]},
+            },
+            {"_id": 0, "tg_username": 1},
+        )
+    }
+    users = [user for user in users if user["tg_username"] in complete]
+    seen = datetime.now(timezone.utc)
+    if users:
+        db.known_users.bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {"_id": user["tg_id"]},
+                    {"$set": {"tg_username": user["tg_username"], "seen": seen}},
+                    upsert=True,
+                )
+                for user in users
+            ],
+            ordered=False,
+        )
+
+    return result.modified_count, list(known) + [user["tg_id"] for user in users]
+
+
+def ensure_indexes(db: Database) -> dict[str, str]:
+    """
+    Creates indexes needed by the bot (see INDEXES) if they don't exist yet.
+    Safe to call on every start: existing indexes are left as is.
+    Returns dictionary with state of every index: 'exists', 'created'
+    or 'failed' with reason (e.g. duplicates prevent unique index from building).
+    """
+
+    states = {}
+
+    indexes = INDEXES + TASK_INDEXES if TASKS_IN_COLLECTION else INDEXES
+    for collection, keys, options in indexes:
+        name = f"{collection}.{options['name']}"
+        try:
+            existing = db[collection].index_information()
+            if options["name"] in existing.keys():
+                states[name] = "exists"
+            else:
+                db[collection].create_index(keys, **options)
+                states[name] = "created"
+        except PyMongoError as e:
+            states[name] = f"failed: {e}"
+            logger.error(f"Couldn't create index '{name}': {e}")
+
+    logger.info(
+        "State of indexes: "
+        + ", ".join(f"{name} - {state}" for name, state in states.items())
+    )
+
+    return states
+
+
+def expand_days_of_week(expression: str) -> list[str]:
+    """
+    Returns days of week (in order of DAYS_OF_WEEK) matched by day_of_week field
+    of cron trigger of APScheduler, e.g. 'mon-fri', 'mon,wed-fri' or '*/2'.
+    Days could be given by names or numbers (0 is monday, as in APScheduler),
+    ranges could have a step. Raises ValueError on unknown day or wrong step.
+    """
+
+    # Days of week in order of APScheduler, starting from monday
+    weekdays = DAYS_OF_WEEK[1:] + DAYS_OF_WEEK[:1]
+
+    def to_index(day: str) -> int:
+        if day in weekdays:
+            return weekdays.index(day)
+        if day.isdigit() and int(day) < len(weekdays):
+            return int(day)
+        raise ValueError(f"Unknown day of week '{day}'")
+
+    matched = set()
+    for part in expression.lower().replace(" ", "").split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f"Wrong step in '{part}'")
+        if span == "*":
+            first, last = 0, len(weekdays) - 1
+        else:
+            start, _, end = span.partition("-")
+            first = to_index(start)
+            # Step without range means till the end of week
+            last = to_index(end) if end else len(weekdays) - 1 if step > 1 else first
+        # Range could go over the end of week, e.g. 'sat-mon'
+        length = (last - first) % len(weekdays) + 1
+        matched.update(
+            weekdays[(first + shift) % len(weekdays)] for shift in range(0, length, step)
+        )
+    return [day for day in DAYS_OF_WEEK if day in matched]
+
+
+def find_worker(key: str, value: ObjectId | str, db: Database) -> dict | None:
+    """
+    Read-through lookup of staff record by one of the fields:
+    '_id', 'tg_id' or 'tg_username'.
+    Cached record is returned if present, otherwise record is read
+    from staff collection and cached.
+    Returns None if nothing found. Database errors are raised to calling side.
+    """
+
+    record = STAFF_CACHE.get(key, value)
+    if not record:
+        record = db.staff.find_one({key: value})
+        if record and type(record) is dict:
+            STAFF_CACHE.put(record)
+
+    return record
+
+
+def for_reads(db: Database) -> Database:
+    """
+    Returns database instance which reads according to READ_PREFERENCE
+    and MAX_STALENESS settings (checked once on import). Used by helpers which only read data
+    and could tolerate slightly stale data (reminders, statuses, teams).
+    Writes and reads of just written data should use given database (primary).
+    """
+
+    # Primary (or unknown preference, see above) is default of given database
+    if READ_PREFERENCE not in READ_PREFERENCES.keys():
+        return db
+
+    preference = READ_PREFERENCES[READ_PREFERENCE](max_staleness=MAX_STALENESS)
+    return db.with_options(read_preference=preference)
+
+
+def forget_delivery(
+    project_id: ObjectId | str,
+    kind: str,
+    day: str,
+    recipient: str,
+    digest: str,
+    db: Database,
+) -> None:
+    """
+    Removes message (its digest) recorded by record_delivery, when it turned out
+    not to be delivered, so next run of reminder sends it again.
+    """
+
+    db.deliveries.update_one(
+        {
+            "project_id": ObjectId(project_id),
+            "kind": kind,
+            "date": day,
+            "recipient": recipient,
+        },
+        {"$pull": {"sent": digest}},
+    )
+
+
 def get_active_project(
     pm_tg_id: str, db: Database, include_tasks: bool = False
 ) -> dict:
@@ -169,40 +898,43 @@ def get_active_project(
     - makes one project active if there were not,
     - if more than one active: leave only one active.
     Returns empty dictionary if no projects found for user.
+    Active project of PM is remembered (see ACTIVE_PROJECT_CACHE),
+    so usually it takes just one query by ObjectId.
     """
 
     project = {}
+    projection = None if include_tasks else {"tasks": 0}
 
-    # Сount projects of PM
-    docs_count = db.projects.count_documents({"pm_tg_id": pm_tg_id})
-    if docs_count > 0:
-        # If more than 0 then count actives, otherwise raise ValueError
-        actives_count = db.projects.count_documents(
-            {"pm_tg_id": pm_tg_id, "active": True}
+    # Known active project still should be active and belong to PM
+    oid = ACTIVE_PROJECT_CACHE.get(pm_tg_id)
+    if oid:
+        project = db.projects.find_one(
+            {"_id": oid, "pm_tg_id": pm_tg_id, "active": True}, projection
+        )
+        if not project:
+            ACTIVE_PROJECT_CACHE.invalidate(pm_tg_id)
+
+    if not project:
+        # One atomic operation to choose active project:
+        # active one goes first, otherwise the oldest one is made active
+        # (revision changes only if project wasn't active)
+        revision = {"$ifNull": ["$revision", 0]}
+        project = db.projects.find_one_and_update(
+            {"pm_tg_id": pm_tg_id},
+            [
+                {
+                    "$set": {
+                        "revision": {
+                            "$cond": ["$active", revision, {"$add": [revision, 1]}]
+                        },
+                        "active": True,
+                    }
+                }
+            ],
+            projection=projection,
+            sort=[("active", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER,
         )
-
-        # If one active get this one
-        if actives_count == 1:
-            if include_tasks:
-                project = db.projects.find_one({"pm_tg_id": pm_tg_id, "active": True})
-            else:
-                project = db.projects.find_one(
-                    {"pm_tg_id": pm_tg_id, "active": True}, {"tasks": 0}
-                )
-
-        # Otherwise if not one -  make one active and remember it
-        elif actives_count == 0:
-            project = db.projects.find_one_and_update(
-                {"pm_tg_id": pm_tg_id, "active": True},
-                {"$set": {"active": True}},
-                {"tasks": 0},
-            )
-
-        # If more than one make all inactive except 1
-        else:
-            project = db.projects.find_one(
-                {"pm_tg_id": pm_tg_id, "active": True}, {"tasks": 0}
-            )
 
         # Check if there is project of proper type to return
         if (
@@ -211,74 +943,211 @@ def get_active_project(
             and "title" in project.keys()
             and project["title"]
         ):
-            # Make other projects inactive
+            # Make other projects inactive (if there were more than one active)
             deactivated = db.projects.update_many(  # noqa: F841
                 {"pm_tg_id": pm_tg_id, "active": True, "_id": {"$ne": project["_id"]}},
-                {"$set": {"active": False}},
+                {"$set": {"active": False}, "$inc": {"revision": 1}},
             )
-
-            # Convert ObjectId of project to string, so it can be serialized to json
-            project["_id"] = str(project["_id"])
-
+            ACTIVE_PROJECT_CACHE.put(pm_tg_id, project["_id"])
         else:
             project = {}
 
+    if project:
+        if include_tasks:
+            attach_tasks([project], db)
+
+        # Convert ObjectId of project to string, so it can be serialized to json
+        project["_id"] = str(project["_id"])
+
     return project
 
 
-def get_assignees(task: dict, db: Database) -> tuple[str, list]:
+def get_actioner_oids(project: dict) -> list[str]:
+    """
+    Collects ObjectIds (as strings) of all actioners of tasks of given project
+    without duplicates, in order of their appearance in tasks.
+    Returns empty list if project has no tasks.
+    """
+
+    oids = []
+    seen = set()
+    if project and "tasks" in project.keys() and project["tasks"]:
+        for task in project["tasks"]:
+            if "actioners" in task.keys() and task["actioners"]:
+                for doer in task["actioners"]:
+                    oid = str(doer["actioner_id"])
+                    if oid not in seen:
+                        seen.add(oid)
+                        oids.append(oid)
+
+    return oids
+
+
+def get_actioner_projects_filter(user_oid: ObjectId | str, db: Database) -> dict:
+    """
+    Returns filter for 'projects' collection to find projects
+    where given user is an actioner of some task.
+    Projects are taken from participation index by ObjectId of user.
+    If user is not there (e.g. index is not built yet), tasks are searched:
+    when tasks are stored in their own collection, ids of such projects
+    are found there first.
+    """
+
+    oid = str(user_oid)
+    entries = get_participation(oid, db)
+    if entries:
+        return {"_id": {"$in": [entry["project_id"] for entry in entries]}}
+
+    embedded = {"tasks.actioners": {"$elemMatch": {"actioner_id": oid}}}
+    if not TASKS_IN_COLLECTION:
+        return embedded
+
+    prj_oids = db.tasks.distinct("project_id", {"actioners.actioner_id": oid})
+
+    # Projects saved before storage was switched keep their tasks inside
+    return {"$or": [{"_id": {"$in": prj_oids}}, embedded]}
+
+
+def get_assignees(
+    task: dict, db: Database, staff: dict[str, dict] | None = None
+) -> tuple[str, list]:
     """
     Helper function for getting names and telegram usernames
     of person assigned to given task to insert in a bot message
     Returns string of the form: '@johntherevelator (John) and @judasofkerioth (Judas)'
     Also returns list of their telegram ids for bot to be able to send direct messages.
+    Staff records are taken from given dictionary (see get_project_actioners),
+    if it is not provided they are requested from DB with one query.
     """
 
     people = ""
     user_tg_ids = []
 
+    if staff is None:
+        staff = get_staff_by_oids(
+            [doer["actioner_id"] for doer in task["actioners"]], db
+        )
+
     for doer in task["actioners"]:
-        try:
-            team_member = db.staff.find_one({"_id": ObjectId(doer["actioner_id"])})
-        except PyMongoError as e:
-            logger.error(f"Error using DB: {e}")
-        else:
-            if team_member and type(team_member) is dict:
-                if "tg_id" in team_member.keys() and team_member["tg_id"]:
-                    user_tg_ids.append(team_member["tg_id"])
-                if len(people) > 0:
-                    people = (
-                        people
-                        + "and @"
-                        + team_member["tg_username"]
-                        + " ("
-                        + team_member["name"]
-                        + ")"
-                    )
-                else:
-                    people = (
-                        f"{people}@{team_member['tg_username']} ({team_member['name']})"
-                    )
+        team_member = staff.get(str(doer["actioner_id"]))
+        if team_member and type(team_member) is dict:
+            if "tg_id" in team_member.keys() and team_member["tg_id"]:
+                user_tg_ids.append(team_member["tg_id"])
+            if len(people) > 0:
+                people = (
+                    people
+                    + " and @"
+                    + team_member["tg_username"]
+                    + " ("
+                    + team_member["name"]
+                    + ")"
+                )
+            else:
+                people = (
+                    f"{people}@{team_member['tg_username']} ({team_member['name']})"
+                )
 
     return people, user_tg_ids  # ids will be needed for buttons to ping users
 
 
-def get_db() -> Database:
+def get_changes_msg(summary: dict) -> str:
+    """
+    Composes message for PM from summary of changes made by update_tasks.
+    Returns empty string if nothing was changed.
+    """
+
+    lines = []
+    if summary.get("added"):
+        lines.append(f"Tasks added: {', '.join(summary['added'])}")
+    if summary.get("deleted"):
+        lines.append(f"Tasks deleted: {', '.join(summary['deleted'])}")
+    if summary.get("changed"):
+        lines.append(
+            "Tasks changed: "
+            + "; ".join(
+                f"{name} ({', '.join(fields)})"
+                for name, fields in summary["changed"].items()
+            )
+        )
+    if summary.get("kept_complete"):
+        lines.append(
+            "Completeness set in bot is kept for: "
+            + ", ".join(summary["kept_complete"])
+        )
+
+    return "\n".join(lines)
+
+
+def get_compact_report(
+    header: str,
+    entries: list[tuple[dict, str, InlineKeyboardMarkup | None]],
+) -> list[tuple[str, InlineKeyboardMarkup | None]]:
+    """
+    Packs status messages of tasks (task, message and keyboard as given by
+    get_message_and_button_for_task) into as few messages as possible.
+    Buttons of tasks are collected in keyboard of message their status is in,
+    labeled with id and name of task to tell them apart.
+    New message is started when text would exceed limit of Telegram (4096 characters)
+    or keyboard - limit of buttons (100). Header goes at the beginning of first message.
+    Returns list of messages and their keyboards (None if message has no buttons).
     """
-    Creates connection to mongo server and returns database instance.
+
+    messages = []
+
+    def pack(lines: list[str], buttons: list[InlineKeyboardButton]) -> None:
+        keyboard = [
+            buttons[i:i + REPORT_BUTTONS_PER_ROW]
+            for i in range(0, len(buttons), REPORT_BUTTONS_PER_ROW)
+        ]
+        messages.append(
+            ("\n\n".join(lines), InlineKeyboardMarkup(keyboard) if keyboard else None)
+        )
+
+    # Every line but first is preceded by empty line (2 characters)
+    lines = [header] if header else []
+    length = len(header) if header else -2
+    buttons = []
+    for task, msg, reply_markup in entries:
+        if not msg:
+            continue
+        task_buttons = []
+        if reply_markup:
+            label = f"🏁№{task['id']} {task['name']}"
+            if len(label) > REPORT_BUTTON_LABEL:
+                label = label[:REPORT_BUTTON_LABEL - 1] + "…"
+            task_buttons = [
+                InlineKeyboardButton(label, callback_data=button.callback_data)
+                for row in reply_markup.inline_keyboard
+                for button in row
+            ]
+
+        # Length is counted with HTML tags, so message is never too long after parsing
+        if lines and (
+            length + 2 + len(msg) > MessageLimit.MAX_TEXT_LENGTH
+            or len(buttons) + len(task_buttons)
+            > InlineKeyboardMarkupLimit.TOTAL_BUTTON_NUMBER
+        ):
+            pack(lines, buttons)
+            lines, length, buttons = [], -2, []
+        lines.append(msg)
+        length += 2 + len(msg)
+        buttons.extend(task_buttons)
+    if lines:
+        pack(lines, buttons)
+
+    return messages
+
+
+def get_db(client: pymongo.MongoClient | None = None) -> Database:
+    """
+    Checks connection to mongo server and returns database instance.
+    Given client is used (so it could be shared with job store),
+    otherwise new one is created by get_mongo_client.
     Raises exception if not succeed.
     """
-    load_dotenv()
-    BOT_NAME = os.environ.get("BOT_NAME")
-    BOT_PASS = os.environ.get("BOT_PASS")
 
-    # link to database
-    DB_NAME = os.environ.get("DB_NAME", "database")
-    host = "127.0.0.1:27017"
-    if not BOT_NAME or not BOT_PASS:
-        raise AttributeError("Can't get bot credentials from environment.")
-    uri = "mongodb://%s:%s@%s" % (quote_plus(BOT_NAME), quote_plus(BOT_PASS), host)
-    client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=1000)
+    if client is None:
+        client = get_mongo_client()
 
     # Check for connection
     try:
@@ -293,67 +1162,54 @@ def get_db() -> Database:
         return DB
 
 
-def get_job_preset(job_id: str, context: ContextTypes.DEFAULT_TYPE) -> str:
+def get_default_reminders() -> dict:
     """
-    Returns current preset of job in text format to add to messages,
-    based on preset dictionary.
-    Returns empty string if subroutine returned empty dictionary.
+    Returns settings of reminders for new project: time, days of week
+    and state of every reminder, taken from REMINDER_DEFAULTS.
     """
 
-    presets_dict = get_job_preset_dict(job_id, context)
-    if presets_dict:
-        if presets_dict["minute"] < 10:
-            time_preset = f"{presets_dict['hour']}:0{presets_dict['minute']}"
-        else:
-            time_preset = f"{presets_dict['hour']}:{presets_dict['minute']}"
-        preset = f"{presets_dict['state']} {time_preset}, {presets_dict['day_of_week']}"
-    else:
-        preset = ""
-
-    return preset
+    return {
+        kind: {"time": at, "days": list(days), "enabled": True}
+        for kind, (at, days) in REMINDER_DEFAULTS.items()
+    }
 
 
-def get_job_preset_dict(job_id: str, context: ContextTypes.DEFAULT_TYPE) -> dict:
+def get_deliveries(
+    project_id: ObjectId | str, kind: str, day: str, db: Database
+) -> dict[str, set[str]]:
     """
-    Helper function that returns dictionary of current reminder preset for given job id.
-    Returns empty dict if nothing is found or error occured.
+    Returns digests of messages already sent by given reminder of project
+    on given day (ISO date) by recipient (see record_delivery).
+    One query for the whole run. Read from primary, as it must be up to date.
     """
 
-    preset = {}
-    if context.job_queue:
-        job = context.job_queue.scheduler.get_job(job_id)
-        if job:
-            try:
-                # Need to convert time values because they are BaseField type originally.
-                # Better use integers for time in case I will need later to manipulate with them.
-                hour = int(
-                    str(job.trigger.fields[job.trigger.FIELD_NAMES.index("hour")])
-                )
-                minute = int(
-                    str(job.trigger.fields[job.trigger.FIELD_NAMES.index("minute")])
-                )
-                days_preset = str(
-                    job.trigger.fields[job.trigger.FIELD_NAMES.index("day_of_week")]
-                )
-            except (LookupError, AttributeError, ValueError) as e:
-                preset = {}
-                logger.error(
-                    f"Error occured while getting preset for job_id '{job_id}': {e}"
-                )
-            else:
-                # Determine if job is on or off
-                if job.next_run_time:
-                    state = "ON"
-                else:
-                    state = "OFF"
+    return {
+        delivery["recipient"]: set(delivery.get("sent", []))
+        for delivery in db.deliveries.find(
+            {"project_id": ObjectId(project_id), "kind": kind, "date": day},
+            {"_id": 0, "recipient": 1, "sent": 1},
+        )
+    }
 
-                preset = {
-                    "hour": hour,
-                    "minute": minute,
-                    "day_of_week": days_preset,
-                    "state": state,
-                }
-    return preset
+
+def get_due_reminders(slots: list[int], db: Database) -> list[dict]:
+    """
+    Finds projects which have reminders due at given minutes of week
+    (see get_reminder_slot) by indexed 'reminder_slots' field.
+    Returns projects (title and PM only) with list of kinds
+    of due reminders in 'due' field.
+    """
+
+    projects = []
+    for project in for_reads(db).projects.find(
+        {"reminder_slots.at": {"$in": slots}},
+        {"title": 1, "pm_tg_id": 1, "reminder_slots": 1},
+    ):
+        project["due"] = sorted(
+            {slot["kind"] for slot in project["reminder_slots"] if slot["at"] in slots}
+        )
+        projects.append(project)
+    return projects
 
 
 def get_keyboard_and_msg(
@@ -614,11 +1470,15 @@ def get_keyboard_and_msg(
 
 
 def get_message_and_button_for_task(
-    task: dict, project_id: ObjectId, db: Database
+    task: dict,
+    project_id: ObjectId,
+    db: Database,
+    staff: dict[str, dict] | None = None,
 ) -> tuple[str, InlineKeyboardMarkup | None]:
     """
     Helper function to provide status update on task with a button
     (InlineKeyboardReplyMarkup to be sent) to mark such task as complete.
+    Staff records of actioners are taken from given dictionary if provided.
     Returns tuple of empty string and Nonetype object if task not worth mention.
     """
     msg = ""
@@ -641,7 +1501,7 @@ def get_message_and_button_for_task(
             if delta_end.days == 0:
                 msg = f"🎌Today is the day of planned milestone '{task['name']}'!🎌"
         else:
-            people, user_tg_ids = get_assignees(task, db)
+            people, user_tg_ids = get_assignees(task, db, staff)
             if not people:
                 people = "can't say, better check assignments in project file."
 
@@ -681,25 +1541,167 @@ def get_message_and_button_for_task(
     return msg, reply_markup
 
 
-def get_project_by_title(db: Database, pm_tg_id: str, title: str) -> dict:
+def get_mongo_client() -> pymongo.MongoClient:
+    """
+    Creates client of mongo server configured from environment.
+    Client keeps pool of connections, so one client should be created
+    and shared by data layer and job store.
+    Settings (besides credentials BOT_NAME and BOT_PASS):
+    - MONGO_HOSTS: comma separated list of host:port (default '127.0.0.1:27017'),
+    - MONGO_REPLICA_SET: name of replica set,
+    - MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE: limits of connection pool (100 and 0),
+    - MONGO_WAIT_QUEUE_TIMEOUT_MS: how long to wait for free connection from pool,
+    - MONGO_SERVER_SELECTION_TIMEOUT_MS (1000), MONGO_CONNECT_TIMEOUT_MS (20000),
+    MONGO_SOCKET_TIMEOUT_MS: timeouts of connection,
+    - MONGO_COMPRESSORS: compression of traffic, e.g. 'zstd,snappy,zlib',
+    - MONGO_WRITE_CONCERN: e.g. 'majority' or '1'.
+    Connection itself is made on first operation.
+    Raises AttributeError if credentials not found.
+    """
+    load_dotenv()
+    BOT_NAME = os.environ.get("BOT_NAME")
+    BOT_PASS = os.environ.get("BOT_PASS")
+    if not BOT_NAME or not BOT_PASS:
+        raise AttributeError("Can't get bot credentials from environment.")
+
+    hosts = os.environ.get("MONGO_HOSTS", "127.0.0.1:27017")
+    uri = "mongodb://%s:%s@%s" % (quote_plus(BOT_NAME), quote_plus(BOT_PASS), hosts)
+
+    options = {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        "serverSelectionTimeoutMS": int(
+            os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 1000)
+        ),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 20000)),
+    }
+
+    # Options without defaults are passed only if set
+    for option, variable in (
+        ("waitQueueTimeoutMS", "MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        ("socketTimeoutMS", "MONGO_SOCKET_TIMEOUT_MS"),
+    ):
+        if os.environ.get(variable):
+            options[option] = int(os.environ[variable])
+    if os.environ.get("MONGO_REPLICA_SET"):
+        options["replicaset"] = os.environ["MONGO_REPLICA_SET"]
+    if os.environ.get("MONGO_COMPRESSORS"):
+        options["compressors"] = os.environ["MONGO_COMPRESSORS"]
+    if os.environ.get("MONGO_WRITE_CONCERN"):
+        w = os.environ["MONGO_WRITE_CONCERN"]
+        options["w"] = int(w) if w.isdigit() else w
+
+    return pymongo.MongoClient(uri, **options)
+
+
+def get_next_events(tasks: Iterable[dict], day: date | None = None) -> dict:
+    """
+    Calculates dates of next events of project from its tasks as of given day
+    (today by default), so reminders could tell idle days without loading tasks
+    (see has_events):
+    - 'start': nearest start of uncompleted task,
+    - 'deadline': nearest due date of uncompleted task,
+    - 'milestone': nearest milestone,
+    - 'started': earliest start of uncompleted task which has already started
+    (it's in progress or overdue, so it's reported every morning).
+    Common tasks (consist of subtasks) are skipped, as they are never reported.
+    Dates are ISO strings, None if there is no such event.
+    'day' is the day markers were calculated for.
+    """
+
+    if day is None:
+        day = date.today()
+    today = day.isoformat()
+    events = {"day": today, "start": None, "deadline": None, "milestone": None, "started": None}
+
+    def earliest(key: str, value: str) -> None:
+        if value and (events[key] is None or value < events[key]):
+            events[key] = value
+
+    for task in tasks:
+        startdate = task.get("startdate") or ""
+        enddate = task.get("enddate") or ""
+        if task.get("milestone"):
+            if enddate >= today:
+                earliest("milestone", enddate)
+            continue
+        if task.get("include") or (task.get("complete") or 0) >= 100:
+            continue
+        if startdate >= today:
+            earliest("start", startdate)
+        else:
+            earliest("started", startdate)
+        if enddate >= today:
+            earliest("deadline", enddate)
+
+    return events
+
+
+def get_next_reminder_time(
+    reminder: dict, now: datetime | None = None, offset: int = 0
+) -> datetime | None:
+    """
+    Returns next time (local) when given reminder would be sent
+    if it's turned on, or None if its settings are wrong.
+    Offset of project (see get_reminder_offset) is added to time of reminder.
+    """
+
+    slots = get_reminder_slots({"reminder": dict(reminder, enabled=True)}, offset)
+    if not slots:
+        return None
+
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    current = get_reminder_slot(now)
+    minutes = min(
+        (slot["at"] - current - 1) % MINUTES_OF_WEEK + 1 for slot in slots
+    )
+    return now + timedelta(minutes=minutes)
+
+
+def get_participation(
+    user_oid: ObjectId | str, db: Database, role: str = ROLE_ACTIONER
+) -> list[dict]:
+    """
+    Returns entries of participation index for given user in given role:
+    ObjectId of project, its title, telegram id of its PM and all roles of user.
+    One keyed lookup, no projects or tasks are scanned.
+    """
+
+    return list(
+        db.participation.find(
+            {"staff_id": str(user_oid), "roles": role},
+            {"_id": 0, "project_id": 1, "title": 1, "pm_tg_id": 1, "roles": 1},
+        )
+    )
+
+
+def get_project_by_title(
+    db: Database, pm_tg_id: str, title: str, include_tasks: bool = True
+) -> dict:
     """
     Get project from database by title for given telegram id of PM.
+    Tasks are read from 'tasks' collection if they are stored there.
+    Without tasks if asked (to select them later by get_tasks_to_report).
+    Read-only: served according to READ_PREFERENCE.
     Returns empty dict if nothing was found.
     """
 
     project = {}
+    db = for_reads(db)
 
     # Get project from DB
-    project = db.projects.find_one({"pm_tg_id": pm_tg_id, "title": title})
+    projection = None if include_tasks else {"tasks": 0}
+    project = db.projects.find_one({"pm_tg_id": pm_tg_id, "title": title}, projection)
+    if project and type(project) is dict and include_tasks:
+        attach_tasks([project], db)
 
     # Check that returned all data needed
     if (
         project
         and type(project) is dict
-        and "tasks" in project.keys()
         and "pm_tg_id" in project.keys()
-        and project["tasks"]
         and project["pm_tg_id"]
+        and (not include_tasks or ("tasks" in project.keys() and project["tasks"]))
     ):
         # Add PM username
         pm_username = get_worker_tg_username_by_tg_id(pm_tg_id, db)
@@ -713,25 +1715,43 @@ def get_project_by_title(db: Database, pm_tg_id: str, title: str) -> dict:
     return project
 
 
+def get_project_actioners(project: dict, db: Database) -> dict[str, dict]:
+    """
+    Resolves all actioners of tasks of given project with one query to DB.
+    Returns dictionary of staff records with ObjectIds (as strings) as keys
+    to render status messages and reminders from.
+    Read-only: served according to READ_PREFERENCE.
+    Returns empty dictionary if project has no actioners or something went wrong.
+    """
+
+    return get_staff_by_oids(get_actioner_oids(project), for_reads(db))
+
+
 def get_projects_and_pms_for_user(user_oid: ObjectId | str, db: Database) -> str:
     """
     Function to get string of projects (and their PMs)
     where user participate as an actioner.
+    Titles and PMs are taken from participation index,
+    projects are searched only if user is not there.
+    Read-only: served according to READ_PREFERENCE.
     Return empty string if nothing was found.
     """
 
     projects_and_pms = ""
+    db = for_reads(db)
 
     # Convert user_oid to string before search in db
     oid = str(user_oid)
 
     try:
-        projects = list(
-            db.projects.find(
-                {"tasks.actioners": {"$elemMatch": {"actioner_id": oid}}},
-                {"title": 1, "pm_tg_id": 1, "_id": 0},
+        projects = get_participation(oid, db)
+        if not projects:
+            projects = list(
+                db.projects.find(
+                    get_actioner_projects_filter(oid, db),
+                    {"title": 1, "pm_tg_id": 1, "_id": 0},
+                )
             )
-        )
     except PyMongoError as e:
         logger.error(f"Error using DB: {e}")
     else:
@@ -758,19 +1778,30 @@ def get_projects_and_pms_for_user(user_oid: ObjectId | str, db: Database) -> str
     return projects_and_pms
 
 
-def get_project_team(prj_oid: ObjectId | str, db: Database) -> list[dict]:
+def get_project_team(project: dict | ObjectId | str, db: Database) -> list[dict]:
     """
-    Construct list of project team members by given id of project.
+    Construct list of project team members by given project.
+    Project could be given as already loaded dictionary (with tasks)
+    or as id, then only actioners of its tasks are loaded from DB.
+    Team members are loaded with one query.
+    Read-only: served according to READ_PREFERENCE.
     Returns empty list if it is not possible to achieve or something went wrong.
     """
     team = []
+    db = for_reads(db)
 
-    if type(prj_oid) is str:
-        project = db.projects.find_one({"_id": ObjectId(prj_oid)})
-    elif type(prj_oid) is ObjectId:
-        project = db.projects.find_one({"_id": prj_oid})
-    else:
-        project = {}
+    # Load only what is needed if project itself not provided
+    if type(project) is not dict or "tasks" not in project.keys():
+        prj_oid = project["_id"] if type(project) is dict else project
+        try:
+            project = db.projects.find_one(
+                {"_id": ObjectId(prj_oid)}, {"title": 1, "tasks.actioners": 1}
+            )
+            if project:
+                attach_tasks([project], db, {"actioners": 1})
+        except (InvalidId, PyMongoError, TypeError) as e:
+            logger.error(f"Error getting project '{prj_oid}' from DB: {e}")
+            project = {}
 
     if (
         project
@@ -778,27 +1809,15 @@ def get_project_team(prj_oid: ObjectId | str, db: Database) -> list[dict]:
         and "tasks" in project.keys()
         and project["tasks"]
     ):
-        # Loop through project tasks and gather information about project team
-        for task in project["tasks"]:
-            # Process only tasks with actioners
-            if "actioners" in task.keys() and task["actioners"]:
-                for actioner in task["actioners"]:
-                    # Proceed if such actioner not in team already
-                    if not any(
-                        str(actioner["actioner_id"]) in str(member["_id"])
-                        for member in team
-                    ):
-                        try:
-                            result = db.staff.find_one(
-                                {"_id": ObjectId(actioner["actioner_id"])}
-                            )
-                        except PyMongoError as e:
-                            logger.error(f"Error using DB: {e}")
-                        else:
-                            if result and type(result) is dict:
-                                # Convert ObjectId to string for further serialization to json
-                                result["_id"] = str(result["_id"])
-                                team.append(result)
+        # Gather information about project team in order of appearance in tasks
+        oids = get_actioner_oids(project)
+        staff = get_staff_by_oids(oids, db)
+        for oid in oids:
+            if oid in staff.keys():
+                # Convert ObjectId to string for further serialization to json
+                member = dict(staff[oid])
+                member["_id"] = oid
+                team.append(member)
 
         if not team:
             logger.error(
@@ -809,13 +1828,127 @@ def get_project_team(prj_oid: ObjectId | str, db: Database) -> list[dict]:
     return team
 
 
-def get_status_on_project(project: dict, user_oid: ObjectId | str, db: Database) -> str:
+def get_reminder_preset(reminder: dict | None) -> str:
+    """
+    Returns current preset of reminder in text format to add to messages,
+    e.g. 'ON 10:00, mon,tue,wed'.
+    Returns empty string if reminder is not set.
+    """
+
+    if not (
+        reminder
+        and type(reminder) is dict
+        and "time" in reminder.keys()
+        and "days" in reminder.keys()
+    ):
+        return ""
+
+    state = "ON" if reminder.get("enabled") else "OFF"
+    return f"{state} {reminder['time']}, {','.join(reminder['days'])}"
+
+
+def get_reminder_offset(project_id: ObjectId | str) -> int:
+    """
+    Returns how many minutes after their time reminders of given project are sent:
+    number within REMINDER_SPREAD window derived from id of project.
+    Checksum is used instead of hash(), which differs between runs of python.
+    """
+
+    return zlib.crc32(str(project_id).encode()) % REMINDER_SPREAD
+
+
+def get_reminder_slot(moment: datetime) -> int:
+    """Returns minute of week (counted from sunday midnight) of given time"""
+
+    # Weekday of python starts from monday
+    day = (moment.weekday() + 1) % len(DAYS_OF_WEEK)
+    return (day * 24 + moment.hour) * 60 + moment.minute
+
+
+def get_reminder_slots(reminders: dict, offset: int = 0) -> list[dict]:
+    """
+    Returns minutes of week (see get_reminder_slot) when turned on reminders
+    of project are due, e.g. [{"kind": "friday_update", "at": 8100}],
+    shifted by given offset (minutes) of project (see get_reminder_offset).
+    It's stored in 'reminder_slots' field of project for dispatcher.
+    Reminders with wrong settings are skipped.
+    """
+
+    slots = []
+    for kind, reminder in reminders.items():
+        if not (reminder and type(reminder) is dict and reminder.get("enabled")):
+            continue
+        try:
+            hour, minute = map(int, reminder["time"].split(":"))
+            moment = time(hour, minute)
+        except (AttributeError, KeyError, ValueError) as e:
+            logger.error(f"Wrong time of reminder '{kind}': {e}")
+            continue
+        for day in reminder.get("days", []):
+            if day in DAYS_OF_WEEK:
+                slots.append(
+                    {
+                        "kind": kind,
+                        "at": (
+                            (DAYS_OF_WEEK.index(day) * 24 + moment.hour) * 60
+                            + moment.minute
+                            + offset
+                        )
+                        % MINUTES_OF_WEEK,
+                    }
+                )
+    return slots
+
+
+def get_staff_by_oids(oids: Iterable[ObjectId | str], db: Database) -> dict[str, dict]:
+    """
+    Gets staff records for given ObjectIds.
+    Records which are not cached are requested from DB with one query.
+    Returns dictionary with ObjectIds (as strings) as keys and records as values,
+    ids not found in staff collection are absent in it.
+    """
+
+    staff = {}
+    missing = []
+
+    for oid in set(str(oid) for oid in oids):
+        if not ObjectId.is_valid(oid):
+            logger.error(f"Invalid ObjectId of actioner: '{oid}'")
+            continue
+        record = STAFF_CACHE.get("_id", oid)
+        if record:
+            staff[oid] = record
+        else:
+            missing.append(ObjectId(oid))
+
+    if missing:
+        try:
+            records = list(db.staff.find({"_id": {"$in": missing}}))
+        except PyMongoError as e:
+            logger.error(f"Error using DB: {e}")
+        else:
+            for record in records:
+                STAFF_CACHE.put(record)
+                staff[str(record["_id"])] = record
+
+    return staff
+
+
+def get_status_on_project(
+    project: dict,
+    user_oid: ObjectId | str,
+    db: Database,
+    staff: dict[str, dict] | None = None,
+) -> str:
     """
     Function composes message which contains status update
     on given project for given ObjectId of actioner.
+    Staff record of actioner is taken from given dictionary if provided.
+    Read-only: served according to READ_PREFERENCE.
     Returns composed message to be sent.
     """
 
+    db = for_reads(db)
     bot_msg = f"Status of events for project '<b>{project['title']}</b>':"
 
     # Add PM username
@@ -832,7 +1965,10 @@ def get_status_on_project(project: dict, user_oid: ObjectId | str, db: Database)
     inform_of_milestone = project["settings"]["INFORM_ACTIONERS_OF_MILESTONES"]
 
     # Get user telegram username to add to message
-    actioner_username = get_worker_tg_username_by_oid(user_oid, db)
+    if staff and str(user_oid) in staff.keys():
+        actioner_username = staff[str(user_oid)]["tg_username"]
+    else:
+        actioner_username = get_worker_tg_username_by_oid(user_oid, db)
     if actioner_username:
         # Find task to inform about: not completed yet, not a milestone,
         # not common task (doesn't consist of subtasks), and this user assigned to it
@@ -910,6 +2046,150 @@ def get_status_on_project(project: dict, user_oid: ObjectId | str, db: Database)
     return bot_msg
 
 
+def get_tasks_to_report(
+    project: dict,
+    kind: str,
+    db: Database,
+    day: date | None = None,
+    actioner_oid: ObjectId | str = "",
+) -> list[dict]:
+    """
+    Selects with aggregation pipeline only tasks of given project
+    which are worth to mention in report of given kind on given day (today by default):
+    - REPORT_DAY_BEFORE: uncompleted tasks which start or end tomorrow,
+    milestones of tomorrow (if project's INFORM_ACTIONERS_OF_MILESTONES is set);
+    - REPORT_STATUS: uncompleted tasks which started, in progress, due today or overdue,
+    uncompleted milestones of today and future, milestones of today
+    (if project's INFORM_ACTIONERS_OF_MILESTONES is set).
+    If actioner given, tasks (but not milestones) are limited to ones assigned to him.
+    Dates are stored as ISO strings, so they are compared as strings.
+    Selected tasks still have to be checked by functions which compose messages.
+    In 'collection' mode tasks inside project document are looked for only
+    if project isn't marked with 'tasks_in_collection' (saved before storage was switched).
+    Read-only: served according to READ_PREFERENCE.
+    Returns empty list if nothing found or something went wrong.
+    """
+
+    db = for_reads(db)
+    if day is None:
+        day = date.today()
+    inform_of_milestone = (
+        "settings" in project.keys()
+        and project["settings"].get("INFORM_ACTIONERS_OF_MILESTONES", False)
+    )
+
+    # Task which is a common task (consist of subtasks) is never reported
+    uncompleted = {"complete": {"$lt": 100}, "include.0": {"$exists": False}}
+    assigned = {"actioners.actioner_id": str(actioner_oid)} if actioner_oid else {}
+
+    if kind == REPORT_DAY_BEFORE:
+        tomorrow = (day + timedelta(days=1)).isoformat()
+        conditions = [
+            {
+                **uncompleted,
+                **assigned,
+                "milestone": False,
+                "$or": [{"startdate": tomorrow}, {"enddate": tomorrow}],
+            }
+        ]
+        if inform_of_milestone:
+            conditions.append({"milestone": True, "enddate": tomorrow})
+    elif kind == REPORT_STATUS:
+        today = day.isoformat()
+        conditions = [
+            {
+                **uncompleted,
+                **assigned,
+                "milestone": False,
+                "$or": [{"startdate": {"$lte": today}}, {"enddate": today}],
+            },
+            {**uncompleted, "milestone": True, "enddate": {"$gte": today}},
+        ]
+        if inform_of_milestone:
+            conditions.append({"milestone": True, "enddate": today})
+    else:
+        raise ValueError(f"Unknown kind of report: '{kind}'")
+
+    match = {"$match": {"$or": conditions}}
+    prj_oid = ObjectId(project["_id"])
+    embedded = [
+        {"$match": {"_id": prj_oid}},
+        {"$unwind": "$tasks"},
+        {"$replaceRoot": {"newRoot": "$tasks"}},
+        match,
+    ]
+
+    tasks = []
+    try:
+        if TASKS_IN_COLLECTION:
+            tasks = list(
+                db.tasks.aggregate(
+                    [
+                        {"$match": {"project_id": prj_oid}},
+                        match,
+                        {"$sort": {"id": 1}},
+                        {"$project": {"_id": 0, "project_id": 0}},
+                    ]
+                )
+            )
+
+        # Tasks are inside project document by default or if saved before storage
+        # was switched (projects whose tasks were written to collection are marked)
+        if not tasks and not (TASKS_IN_COLLECTION and project.get("tasks_in_collection")):
+            tasks = list(db.projects.aggregate(embedded))
+    except PyMongoError as e:
+        logger.error(f"Error selecting tasks of project '{project['_id']}' for report: {e}")
+
+    return tasks
+
+
+def get_tasks_update(changes: dict) -> dict:
+    """
+    Makes fields of update pipeline for project document which applies
+    given changes of tasks (see diff_tasks) to array of tasks inside it
+    and increments revision of project. All changes are made at once,
+    so only changed fields and new tasks are sent to database.
+    """
+
+    task = "$$task"
+    if changes["updated"]:
+        # Changed fields are merged into task found by its id
+        task = {
+            "$switch": {
+                "branches": [
+                    {
+                        "case": {"$eq": ["$$task.id", task_id]},
+                        "then": {"$mergeObjects": ["$$task", {"$literal": fields}]},
+                    }
+                    for task_id, fields in changes["updated"].items()
+                ],
+                "default": "$$task",
+            }
+        }
+
+    return {
+        "tasks": {
+            "$concatArrays": [
+                {
+                    "$map": {
+                        "input": {
+                            "$filter": {
+                                "input": {"$ifNull": ["$tasks", []]},
+                                "as": "task",
+                                "cond": {"$not": [{"$in": ["$$task.id", changes["deleted"]]}]},
+                            }
+                        },
+                        "as": "task",
+                        "in": task,
+                    }
+                },
+                {"$literal": changes["inserted"]},
+            ]
+        },
+        "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]},
+    }
+
+
 def get_worker_oid_from_db_by_tg_username(tg_username: str, db: Database) -> str:
     """
     Search staff collection in DB for given telegram username and
@@ -920,7 +2200,7 @@ def get_worker_oid_from_db_by_tg_username(tg_username: str, db: Database) -> str
     worker_id = ""
 
     try:
-        result = db.staff.find_one({"tg_username": tg_username})
+        result = find_worker("tg_username", tg_username, db)
     except PyMongoError as e:
         logger.error(f"Error using DB: {e}")
     else:
@@ -946,7 +2226,7 @@ def get_worker_oid_from_db_by_tg_id(tg_id: str, db: Database) -> str:
     worker_id = ""
 
     try:
-        result = db.staff.find_one({"tg_id": str(tg_id)})
+        result = find_worker("tg_id", str(tg_id), db)
     except PyMongoError as e:
         logger.error(f"Error using DB: {e}")
     else:
@@ -972,7 +2252,7 @@ def get_worker_tg_id_from_db_by_tg_username(tg_username: str, db: Database) -> s
     tg_id = ""
 
     try:
-        result = db.staff.find_one({"tg_username": tg_username})
+        result = find_worker("tg_username", tg_username, db)
     except PyMongoError as e:
         logger.error(f"Error using DB: {e}")
     else:
@@ -997,9 +2277,9 @@ def get_worker_tg_username_by_oid(user_oid: ObjectId | str, db: Database) -> str
 
     try:
         if type(user_oid) is str:
-            result = db.staff.find_one({"_id": ObjectId(user_oid)})
+            result = find_worker("_id", ObjectId(user_oid), db)
         elif type(user_oid) is ObjectId:
-            result = db.staff.find_one({"_id": user_oid})
+            result = find_worker("_id", user_oid, db)
         else:
             result = {}
 
@@ -1019,7 +2299,7 @@ def get_worker_tg_username_by_tg_id(tg_id: str, db: Database) -> str:
     tg_un = ""
 
     try:
-        result = db.staff.find_one({"tg_id": tg_id})
+        result = find_worker("tg_id", tg_id, db)
     except PyMongoError as e:
         logger.error(f"Error using DB: {e}")
     else:
@@ -1029,16 +2309,704 @@ def get_worker_tg_username_by_tg_id(tg_id: str, db: Database) -> str:
     return str(tg_un)
 
 
+def has_events(project: dict, kind: str, day: date | None = None) -> bool:
+    """
+    Tells by dates of next events of project (see get_next_events) if report
+    of given kind (REPORT_DAY_BEFORE or REPORT_STATUS) could have something
+    to mention on given day (today by default). Markers calculated some days ago
+    are still reliable to tell idle day, they could only say that day isn't idle
+    when it is. Returns True if project has no markers.
+    """
+
+    events = project.get("next_events")
+    if not (events and type(events) is dict and events.get("day")):
+        return True
+    if day is None:
+        day = date.today()
+    if day.isoformat() < events["day"]:
+        return True
+
+    if kind == REPORT_DAY_BEFORE:
+        tomorrow = (day + timedelta(days=1)).isoformat()
+        return any(
+            events.get(key) and events[key] <= tomorrow
+            for key in ("start", "deadline", "milestone")
+        )
+    if kind == REPORT_STATUS:
+        # Uncompleted milestones are reported every morning until their day
+        return bool(events.get("started") or events.get("milestone")) or any(
+            events.get(key) and events[key] <= day.isoformat()
+            for key in ("start", "deadline")
+        )
+    raise ValueError(f"Unknown kind of report: '{kind}'")
+
+
+def index_participation(
+    project_id: ObjectId | str, db: Database, tasks: list[dict] | None = None
+) -> int:
+    """
+    Updates participation index for given project: one entry per staff member
+    (actioners of tasks and PM) with title of project, telegram id of PM and roles.
+    Should be called whenever project is added, its tasks are uploaded,
+    it's renamed or handed over to another PM.
+    Tasks could be given if they are at hand, otherwise they are read from DB.
+    Returns number of participants (project not found - 0).
+    """
+
+    prj_oid = ObjectId(project_id)
+    projection = {"title": 1, "pm_tg_id": 1}
+    if tasks is None and not TASKS_IN_COLLECTION:
+        projection["tasks.actioners.actioner_id"] = 1
+    project = db.projects.find_one({"_id": prj_oid}, projection)
+    if not project:
+        db.participation.delete_many({"project_id": prj_oid})
+        return 0
+
+    roles = {}
+    if tasks is None:
+        # Projects saved before storage was switched keep their tasks inside
+        oids = get_actioner_oids(project)
+        if TASKS_IN_COLLECTION:
+            oids += db.tasks.distinct("actioners.actioner_id", {"project_id": prj_oid})
+    else:
+        oids = get_actioner_oids({"tasks": tasks})
+    for oid in oids:
+        roles.setdefault(str(oid), [ROLE_ACTIONER])
+
+    pm_oid = get_worker_oid_from_db_by_tg_id(project.get("pm_tg_id", ""), db)
+    if pm_oid:
+        roles.setdefault(pm_oid, []).append(ROLE_PM)
+
+    requests = [
+        pymongo.UpdateOne(
+            {"staff_id": oid, "project_id": prj_oid},
+            {
+                "$set": {
+                    "title": project.get("title", ""),
+                    "pm_tg_id": project.get("pm_tg_id", ""),
+                    "roles": staff_roles,
+                }
+            },
+            upsert=True,
+        )
+        for oid, staff_roles in roles.items()
+    ]
+    requests.append(
+        pymongo.DeleteMany({"project_id": prj_oid, "staff_id": {"$nin": list(roles)}})
+    )
+    db.participation.bulk_write(requests, ordered=False)
+
+    return len(roles)
+
+
 def is_db(db) -> bool:
     """
     Function to check is there a connection to DB.
     Return True if database reached, and False otherwise.
+    Server is not contacted: state is tracked by health monitor
+    and database calls (see health.py), so check is cheap.
+    """
+
+    return db is not None and DB_HEALTH.available
+
+
+def migrate_reminders(scheduler: BaseScheduler, db: Database) -> int:
+    """
+    Moves reminders of projects saved before dispatcher of reminders appeared
+    (when every reminder was a job of scheduler and project kept ids of jobs)
+    to settings in project itself. Time, days and state are taken from job
+    (ranges of days like 'mon-fri' are expanded), then job is removed.
+    Projects without reminder_slots field are migrated.
+    Returns number of migrated projects.
+    """
+
+    migrated = 0
+    for project in list(
+        db.projects.find({"reminder_slots": {"$exists": False}}, {"reminders": 1})
+    ):
+        reminders = get_default_reminders()
+        jobs = project.get("reminders") or {}
+        for kind, job_id in jobs.items():
+            job = scheduler.get_job(job_id) if type(job_id) is str else None
+            if not job:
+                continue
+            try:
+                fields = {field.name: str(field) for field in job.trigger.fields}
+                hour, minute = int(fields["hour"]), int(fields["minute"])
+                days = expand_days_of_week(fields["day_of_week"])
+            except (AttributeError, KeyError, ValueError) as e:
+                logger.error(f"Couldn't read preset of job '{job_id}', using default: {e}")
+            else:
+                if not days:
+                    logger.error(
+                        f"Job '{job_id}' of project '{project['_id']}' has no days of week"
+                        f" ('{fields['day_of_week']}'), using default for '{kind}'"
+                    )
+                else:
+                    reminders[kind] = {
+                        "time": f"{hour:02}:{minute:02}",
+                        "days": days,
+                        "enabled": job.next_run_time is not None,
+                    }
+            scheduler.remove_job(job_id)
+
+        db.projects.update_one(
+            {"_id": project["_id"]},
+            {
+                "$set": {
+                    "reminders": reminders,
+                    "reminder_slots": get_reminder_slots(
+                        reminders, get_reminder_offset(project["_id"])
+                    ),
+                    "reminder_spread": REMINDER_SPREAD,
+                },
+                "$inc": {"revision": 1},
+            },
+        )
+        migrated += 1
+
+    if migrated:
+        logger.info(f"Reminders of {migrated} projects moved from jobs to projects")
+    return migrated
+
+
+def modify_project(
+    project_id: ObjectId | str,
+    modify: Callable[[dict], dict | list | None],
+    db: Database,
+    projection: dict | None = None,
+) -> dict | None:
+    """
+    Optimistic concurrency for writes which depend on state of project:
+    reads project (with given projection), gets update from modify(project)
+    and writes it only if revision of project is still the same, incrementing it.
+    If project was changed in between, it's read again and modify is called again
+    (up to REVISION_RETRIES times). Update could be a document or a pipeline,
+    modify returns None if there is nothing to change.
+    Returns project after update (or as read, if nothing changed).
+    Returns None if project was not found or conflicts didn't resolve.
+    """
+
+    prj_oid = ObjectId(project_id)
+    read_projection = projection
+    if projection and any(projection.values()):
+        read_projection = dict(projection, revision=1)
+    for attempt in range(REVISION_RETRIES + 1):
+        project = db.projects.find_one({"_id": prj_oid}, read_projection)
+        if not project:
+            return None
+
+        update = modify(project)
+        if not update:
+            return project
+        if type(update) is list:
+            update = update + [
+                {"$set": {"revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]}}}
+            ]
+        else:
+            update = dict(update)
+            update["$inc"] = dict(update.get("$inc", {}), revision=1)
+
+        modified = db.projects.find_one_and_update(
+            dict(revision_query(project), _id=prj_oid),
+            update,
+            projection=read_projection,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if modified:
+            return modified
+        logger.warning(
+            f"Project {prj_oid} was changed concurrently, trying again"
+            f" (attempt {attempt + 1})"
+        )
+
+    logger.error(f"Couldn't modify project {prj_oid} because of conflicts")
+    return None
+
+
+def record_delivery(
+    project_id: ObjectId | str,
+    kind: str,
+    day: str,
+    recipient: str,
+    digest: str,
+    db: Database,
+) -> None:
     """
+    Remembers that message (its digest) of given reminder of project is sent
+    to recipient on given day (ISO date). One upsert of small document per
+    recipient, expired after DELIVERIES_TTL by index.
+    """
+
+    db.deliveries.update_one(
+        {
+            "project_id": ObjectId(project_id),
+            "kind": kind,
+            "date": day,
+            "recipient": recipient,
+        },
+        {
+            "$addToSet": {"sent": digest},
+            "$setOnInsert": {"created": datetime.now(timezone.utc)},
+        },
+        upsert=True,
+    )
+
+
+def refresh_next_events(
+    project_id: ObjectId | str, db: Database, day: date | None = None
+) -> dict | None:
+    """
+    Recalculates dates of next events of given project (see get_next_events)
+    as of given day (today by default) from its tasks and saves them,
+    if they were changed. Only fields needed for that are read.
+    Written with modify_project, so concurrent change of schedule isn't missed.
+    Returns dates of next events or None if project was not found.
+    """
+
+    def modify(project: dict) -> dict | None:
+        tasks = project.get("tasks") or []
+        if TASKS_IN_COLLECTION and not tasks:
+            tasks = db.tasks.find(
+                {"project_id": project["_id"]},
+                {field: 1 for field in NEXT_EVENTS_FIELDS} | {"_id": 0},
+            )
+        events = get_next_events(tasks, day)
+        if project.get("next_events") == events:
+            return None
+        return {"$set": {"next_events": events}}
+
+    projection = {f"tasks.{field}": 1 for field in NEXT_EVENTS_FIELDS}
+    project = modify_project(project_id, modify, db, projection | {"next_events": 1})
+    return project.get("next_events") if project else None
+
+
+def revision_query(project: dict) -> dict:
+    """
+    Returns condition which matches given project only if its revision
+    is still the same as in given (read) project.
+    Projects saved before revisions were introduced have none, i.e. 0.
+    """
+
+    revision = project.get("revision") or 0
+    if revision:
+        return {"revision": revision}
+    return {"revision": {"$in": [0, None]}}
+
+
+def save_tasks(
+    project_id: ObjectId | str,
+    tasks: list[dict],
+    db: Database,
+    project: dict | None = None,
+) -> Tuple[bool, bool]:
+    """
+    Replaces tasks of given project with given ones.
+    If project as it was read is given, tasks are saved only if its revision
+    didn't change since (see revision_query), otherwise project is not found.
+    When tasks are stored in 'tasks' collection every task is written
+    separately (upserted by project id and task id) in one bulk operation,
+    and tasks which are absent in given list are deleted.
+    Participation index is updated if something was changed,
+    dates of next events of project - always (see get_next_events).
+    Returns pair of flags: project was found, something was changed.
+    """
+
+    prj_oid = ObjectId(project_id)
+    query = dict(revision_query(project), _id=prj_oid) if project else {"_id": prj_oid}
+    if not TASKS_IN_COLLECTION:
+        result = db.projects.update_one(
+            query,
+            {
+                "$set": {"tasks": tasks, "next_events": get_next_events(tasks)},
+                "$inc": {"revision": 1},
+            },
+        )
+        if result.modified_count > 0:
+            index_participation(prj_oid, db, tasks)
+        return result.matched_count > 0, result.modified_count > 0
+
+    # Move tasks out of project document if they were saved there before
+    result = db.projects.update_one(
+        query,
+        {
+            "$set": {
+                "tasks": [],
+                "tasks_in_collection": True,
+                "next_events": get_next_events(tasks),
+            },
+            "$inc": {"revision": 1},
+        },
+    )
+    if result.matched_count == 0:
+        return False, False
+
+    requests = [
+        pymongo.ReplaceOne(
+            {"project_id": prj_oid, "id": task["id"]},
+            dict(task, project_id=prj_oid),
+            upsert=True,
+        )
+        for task in tasks
+    ]
+    requests.append(
+        pymongo.DeleteMany(
+            {"project_id": prj_oid, "id": {"$nin": [task["id"] for task in tasks]}}
+        )
+    )
+    bulk = db.tasks.bulk_write(requests, ordered=False)
+
+    changed = bool(
+        result.modified_count
+        or bulk.upserted_count
+        or bulk.modified_count
+        or bulk.deleted_count
+    )
+    if changed:
+        index_participation(prj_oid, db, tasks)
+    return True, changed
+
+
+def spread_reminders(db: Database) -> int:
+    """
+    Recalculates minutes when reminders are due for projects whose slots were made
+    with another REMINDER_SPREAD window (or before reminders were spread),
+    so change of setting takes effect on start of bot.
+    Returns number of updated projects.
+    """
+
+    def modify(project: dict) -> dict | None:
+        if project.get("reminder_spread") == REMINDER_SPREAD:
+            return None
+        return {
+            "$set": {
+                "reminder_slots": get_reminder_slots(
+                    project.get("reminders") or {}, get_reminder_offset(project["_id"])
+                ),
+                "reminder_spread": REMINDER_SPREAD,
+            }
+        }
+
+    updated = 0
+    for project in list(
+        db.projects.find(
+            {
+                "reminder_slots": {"$exists": True},
+                "reminder_spread": {"$ne": REMINDER_SPREAD},
+            },
+            {"_id": 1},
+        )
+    ):
+        if modify_project(
+            project["_id"], modify, db, {"reminders": 1, "reminder_spread": 1}
+        ):
+            updated += 1
+
+    if updated:
+        logger.info(
+            f"Reminders of {updated} projects spread over {REMINDER_SPREAD} minutes"
+        )
+    return updated
+
+
+def sync_staff(workers: list[dict], db: Database) -> dict[str, str]:
+    """
+    Adds workers (resources from project file) to staff collection
+    with one bulk operation of upserts. Worker is found by telegram id
+    or telegram username (whichever is given), so record which has only one of them
+    (e.g. username, until worker contacted the bot) gets the other. New workers
+    are inserted, for existing ones only empty fields are filled
+    (for ex. PM is actioner in other project).
+    Workers with neither telegram id nor telegram username are skipped,
+    all of them are reported with one error.
+    Returns dictionary of ObjectIds (as strings) of workers by their telegram ids
+    and by their telegram usernames, so worker could be found by either of them.
+    """
+
+    # Check all workers first
+    bad_workers = [
+        worker for worker in workers if not worker.get("tg_id") and not worker.get("tg_username")
+    ]
+    if bad_workers:
+        logger.error(
+            "Not enough information about workers provided: neither tg_id nor"
+            f" tg_username. Skipped {len(bad_workers)} workers:\n"
+            + "\n".join(f"{worker}" for worker in bad_workers)
+        )
+
+    requests = []
+    tg_ids = []
+    tg_usernames = []
+    for worker in workers:
+        keys = [
+            {key: worker[key]} for key in ("tg_id", "tg_username") if worker.get(key)
+        ]
+        if not keys:
+            continue
+        if worker.get("tg_id"):
+            tg_ids.append(worker["tg_id"])
+        if worker.get("tg_username"):
+            tg_usernames.append(worker["tg_username"])
+        query = {"$or": keys} if len(keys) > 1 else keys[0]
+
+        # Update as pipeline lets to check value of field in database:
+        # keep it if filled, otherwise take one from file.
+        # Id from file is not used: loaders take ids from returned dictionary
+        fill_empty = {
+            key: {
+                "$cond": [
+                    {"$in": [{"$ifNull": [f"${key}", ""]}, ["", 0, False, {}, []]]},
+                    {"$literal": value},
+                    f"${key}",
+                ]
+            }
+            for key, value in worker.items()
+            if key != "_id"
+        }
+        requests.append(pymongo.UpdateOne(query, [{"$set": fill_empty}], upsert=True))
+
+    if not requests:
+        return {}
+
+    # Ordered, so the same worker mentioned twice is inserted only once
+    result = db.staff.bulk_write(requests, ordered=True)
+    logger.debug(
+        f"Results of staff sync: '{result.matched_count}' found,"
+        f" '{result.modified_count}' modified, '{result.upserted_count}' added."
+    )
+
+    # Read back ids of workers and refresh cache with actual records
+    records = db.staff.find(
+        {"$or": [{"tg_id": {"$in": tg_ids}}, {"tg_username": {"$in": tg_usernames}}]}
+    )
+    by_tg_id = {}
+    by_tg_username = {}
+    for record in records:
+        STAFF_CACHE.invalidate(
+            oid=record["_id"],
+            tg_id=record.get("tg_id", ""),
+            tg_username=record.get("tg_username", ""),
+        )
+        STAFF_CACHE.put(record)
+        if record.get("tg_id"):
+            by_tg_id[record["tg_id"]] = str(record["_id"])
+        if record.get("tg_username"):
+            by_tg_username[record["tg_username"]] = str(record["_id"])
+
+    # Telegram id goes first: username could be changed by user
+    staff_ids = {}
+    for worker in workers:
+        oid = by_tg_id.get(worker.get("tg_id")) or by_tg_username.get(
+            worker.get("tg_username")
+        )
+        if oid:
+            for key in ("tg_id", "tg_username"):
+                if worker.get(key):
+                    staff_ids[worker[key]] = oid
+
+    return staff_ids
+
+
+def update_reminder(
+    project_id: ObjectId | str,
+    kind: str,
+    db: Database,
+    at: str = "",
+    days: list[str] | None = None,
+    switch: bool = False,
+) -> dict | None:
+    """
+    Changes settings of given reminder of project: time (at, 'HH:MM'), days of week
+    and/or turns it on or off (if switch is True), and recalculates minutes
+    when reminders are due. Dispatcher picks changes up on next minute.
+    Returns project (without tasks) after update or None if it wasn't updated.
+    """
+
+    def modify(project: dict) -> dict:
+        reminders = dict(project.get("reminders") or {})
+        reminder = dict(reminders.get(kind) or get_default_reminders()[kind])
+        if at:
+            reminder["time"] = at
+        if days:
+            reminder["days"] = days
+        if switch:
+            reminder["enabled"] = not reminder.get("enabled")
+        reminders[kind] = reminder
+        return {
+            "$set": {
+                f"reminders.{kind}": reminder,
+                "reminder_slots": get_reminder_slots(
+                    reminders, get_reminder_offset(project["_id"])
+                ),
+                "reminder_spread": REMINDER_SPREAD,
+            }
+        }
 
     try:
-        db.command("ping")
-    except (AttributeError, ServerSelectionTimeoutError) as e:
-        logger.error(f"There was error getting DB: {e}")
-        return False
-    else:
-        return True
+        return modify_project(project_id, modify, db, {"tasks": 0})
+    except KeyError as e:
+        logger.error(f"Unknown reminder {e} of project '{project_id}'")
+        return None
+
+
+def update_tasks(
+    project_id: ObjectId | str, tasks: list[dict], db: Database
+) -> dict | None:
+    """
+    Updates schedule of given project with given tasks (e.g. from uploaded file).
+    Only differences are written (see diff_tasks): changed fields of tasks,
+    new tasks and deletion of absent ones.
+    In 'embedded' mode it's one update of project checked by its revision.
+    In 'collection' mode every changed task is updated only if changed fields
+    still have values which were compared (e.g. task was not completed meanwhile),
+    new tasks are inserted and absent ones deleted only if all updates matched.
+    Tasks stored inside project are moved to collection only if its revision
+    didn't change. On conflict with concurrent write schedule is compared again
+    (up to REVISION_RETRIES times). New tasks are added to the end of schedule.
+    Participation index and dates of next events of project
+    (see refresh_next_events) are updated if something was changed.
+    Returns summary of changes with names of tasks: 'added', 'deleted',
+    'changed' (names of changed fields by name of task) and 'kept_complete'.
+    Returns None if project was not found or conflicts didn't resolve.
+    """
+
+    prj_oid = ObjectId(project_id)
+
+    # Changed tasks written by attempts which ended with conflict
+    merged = {"changed": {}, "kept_complete": []}
+
+    def merge_summary(summary: dict) -> dict:
+        return dict(
+            summary,
+            changed=merged["changed"] | summary["changed"],
+            kept_complete=list(
+                dict.fromkeys(merged["kept_complete"] + summary["kept_complete"])
+            ),
+        )
+
+    for attempt in range(REVISION_RETRIES + 1):
+        project = db.projects.find_one({"_id": prj_oid}, {"tasks": 1, "revision": 1})
+        if not project:
+            return None
+
+        # Projects saved before storage was switched keep their tasks inside
+        stored = project.get("tasks") or []
+        moving = TASKS_IN_COLLECTION and bool(stored)
+        if TASKS_IN_COLLECTION and not stored:
+            stored = list(
+                db.tasks.find({"project_id": prj_oid}, {"_id": 0, "project_id": 0})
+            )
+
+        changes = diff_tasks(stored, tasks)
+        old = {task["id"]: task for task in stored}
+        names = {task["id"]: task.get("name", str(task["id"])) for task in stored}
+        names.update({task["id"]: task.get("name", str(task["id"])) for task in tasks})
+        summary = {
+            "added": [names[task["id"]] for task in changes["inserted"]],
+            "deleted": [names[task_id] for task_id in changes["deleted"]],
+            "changed": {
+                names[task_id]: sorted(fields.keys())
+                for task_id, fields in changes["updated"].items()
+            },
+            "kept_complete": [names[task_id] for task_id in changes["kept_complete"]],
+        }
+        if not (
+            changes["inserted"] or changes["deleted"] or changes["updated"] or moving
+        ):
+            return merge_summary(summary)
+
+        if moving:
+            # Whole schedule is written to collection, with completeness kept,
+            # if project wasn't changed since it was read
+            applied, _ = save_tasks(
+                prj_oid,
+                [
+                    dict(task, complete=old[task["id"]].get("complete"))
+                    if task["id"] in changes["kept_complete"]
+                    else task
+                    for task in tasks
+                ],
+                db,
+                project,
+            )
+            if applied:
+                return merge_summary(summary)
+
+        elif TASKS_IN_COLLECTION:
+            # Guarded updates go first: inserts and deletes are written
+            # only when all of them matched, so conflict leaves schedule
+            # without new or deleted tasks. Updates which matched stay,
+            # so their names are kept for summary of next attempt.
+            written = False
+            applied = True
+            if changes["updated"]:
+                result = db.tasks.bulk_write(
+                    [
+                        pymongo.UpdateOne(
+                            dict(
+                                {key: old[task_id].get(key) for key in fields.keys()},
+                                project_id=prj_oid,
+                                id=task_id,
+                            ),
+                            {"$set": fields},
+                        )
+                        for task_id, fields in changes["updated"].items()
+                    ],
+                    ordered=False,
+                )
+                written = result.modified_count > 0
+                applied = result.matched_count == len(changes["updated"])
+                if not applied:
+                    merged["changed"].update(summary["changed"])
+                    merged["kept_complete"] += summary["kept_complete"]
+
+            if applied:
+                requests = [
+                    pymongo.InsertOne(dict(task, project_id=prj_oid))
+                    for task in changes["inserted"]
+                ]
+                if changes["deleted"]:
+                    requests.append(
+                        pymongo.DeleteMany(
+                            {"project_id": prj_oid, "id": {"$in": changes["deleted"]}}
+                        )
+                    )
+                if requests:
+                    try:
+                        db.tasks.bulk_write(requests, ordered=False)
+                        written = True
+                    except BulkWriteError as e:
+                        # E.g. the same task was inserted by concurrent upload
+                        logger.warning(
+                            f"Conflict while updating tasks of project {prj_oid}: {e}"
+                        )
+                        written = written or e.details.get("nInserted", 0) > 0
+                        applied = False
+
+            # Revision tells that project (or its tasks) was changed
+            if written:
+                db.projects.update_one(
+                    {"_id": prj_oid},
+                    {"$set": {"tasks_in_collection": True}, "$inc": {"revision": 1}},
+                )
+        else:
+            result = db.projects.update_one(
+                dict(revision_query(project), _id=prj_oid),
+                [{"$set": get_tasks_update(changes)}],
+            )
+            applied = result.matched_count > 0
+
+        if applied:
+            index_participation(prj_oid, db, tasks)
+            refresh_next_events(prj_oid, db)
+            return merge_summary(summary)
+        logger.warning(
+            f"Project {prj_oid} was changed concurrently, comparing schedule again"
+            f" (attempt {attempt + 1})"
+        )
+
+    logger.error(
+        f"Couldn't update schedule of project {prj_oid} because of conflicts,"
+        f" changes of tasks written before conflict: {merged['changed']}"
+    )
+    return None
@@ -0,0 +1,305 @@
+"""
+Rate limiter for all requests of the bot to Telegram Bot API.
+Telegram allows about 30 messages per second overall, one message per second
+in a private chat and 20 messages per minute in a group; above that it answers
+with 429 (RetryAfter) and message is lost. So every request to a chat waits
+for its turn in a central queue, which lets requests through at global rate
+when bucket of their chat has a token. Queue has priority lanes:
+interactive replies (default) go ahead of bulk traffic of reminders.
+When Telegram asks to retry after some time, all requests wait for it,
+and the request is repeated.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from collections import deque
+from dotenv import load_dotenv
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from typing import Any, Callable, Coroutine
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+# Limits of Telegram: messages per second overall and in private chat,
+# messages per minute in group chat
+OUT_GLOBAL_RATE = float(os.environ.get("OUT_GLOBAL_RATE", 30))
+OUT_PRIVATE_RATE = float(os.environ.get("OUT_PRIVATE_RATE", 1))
+OUT_GROUP_RATE = float(os.environ.get("OUT_GROUP_RATE", 20))
+# How many times request is repeated after RetryAfter
+OUT_MAX_RETRIES = int(os.environ.get("OUT_MAX_RETRIES", 3))
+
+# Priority lanes of queue (lower goes first), given as rate_limit_args of request.
+# Requests without it are interactive.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+LANES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Buckets of chats are forgotten when they are full and there are more of them
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """
+    Allows given number of requests (rate) per period (in seconds),
+    up to rate requests could go in a burst.
+    """
+
+    def __init__(self, rate: float, period: float = 1) -> None:
+        self.capacity = rate
+        self._tokens = rate
+        self._fill_rate = rate / period
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    @property
+    def idle(self) -> bool:
+        """Bucket is full, so it could be forgotten"""
+        return self.delay() == 0 and self._tokens >= self.capacity
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self._fill_rate
+        )
+        self._updated = now
+
+    def delay(self) -> float:
+        """Returns how long to wait for a token (seconds), 0 if it's available"""
+
+        self._refill()
+        return max(
+            0.0,
+            (1 - self._tokens) / self._fill_rate,
+            self._paused_until - time.monotonic(),
+        )
+
+    def pause(self, seconds: float) -> None:
+        """Gives no tokens for given time"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def take(self) -> None:
+        self._refill()
+        self._tokens -= 1
+
+
+class Lane:
+    """
+    Requests of one priority waiting for their turn, grouped by chat.
+    Only first request of chat could go, so chats are kept in two heaps:
+    ready ones (bucket of chat has a token) ordered by arrival of their first request,
+    and blocked ones ordered by time when their bucket gets a token.
+    So next request is found without looking through the whole queue.
+    """
+
+    def __init__(self) -> None:
+        # Key of chat -> its bucket and requests (number of arrival, future)
+        self._chats = {}
+        self._ready = []
+        self._blocked = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        """Number of chats with waiting requests"""
+        return len(self._chats)
+
+    def add(self, key: str, bucket: TokenBucket, turn: asyncio.Future) -> None:
+        """Puts request of chat to the end of its queue"""
+
+        if key in self._chats:
+            self._chats[key][1].append((next(self._counter), turn))
+            return
+        self._chats[key] = (bucket, deque([(next(self._counter), turn)]))
+        self._schedule(key)
+
+    def _schedule(self, key: str) -> None:
+        """
+        Puts chat to heap of ready or blocked ones by its first request,
+        forgets chat when it has no requests left.
+        Chat is always in one of heaps exactly once while it has requests.
+        """
+
+        bucket, turns = self._chats[key]
+        # Requests could be cancelled while waiting
+        while turns and turns[0][1].done():
+            turns.popleft()
+        if not turns:
+            del self._chats[key]
+            return
+        delay = bucket.delay()
+        if delay == 0:
+            heapq.heappush(self._ready, (turns[0][0], key))
+        else:
+            heapq.heappush(self._blocked, (time.monotonic() + delay, key))
+
+    def peek(self) -> tuple[str | None, float | None]:
+        """
+        Returns key of chat which first request could go now.
+        If there is no such chat returns how long to wait for the nearest
+        token of chat (None if lane is empty).
+        """
+
+        now = time.monotonic()
+        while self._blocked and self._blocked[0][0] <= now:
+            _, key = heapq.heappop(self._blocked)
+            self._schedule(key)
+        while self._ready:
+            number, key = self._ready[0]
+            bucket, turns = self._chats[key]
+            if turns[0][0] == number and not turns[0][1].done() and bucket.delay() == 0:
+                return key, None
+            # First request was cancelled or token was taken by other lane
+            heapq.heappop(self._ready)
+            self._schedule(key)
+        if self._blocked:
+            return None, max(0.0, self._blocked[0][0] - now)
+        return None, None
+
+    def pop(self) -> asyncio.Future:
+        """Takes first request of chat found by peek() and a token of chat for it"""
+
+        _, key = heapq.heappop(self._ready)
+        bucket, turns = self._chats[key]
+        _, turn = turns.popleft()
+        bucket.take()
+        self._schedule(key)
+        return turn
+
+
+class OutboundLimiter(BaseRateLimiter[int]):
+    """
+    Throttles requests which have chat_id: they wait in queue with priority
+    lanes until both bucket of their chat and global bucket have a token.
+    Other requests (e.g. answers to callback queries) are not delayed.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = OUT_GLOBAL_RATE,
+        private_rate: float = OUT_PRIVATE_RATE,
+        group_rate: float = OUT_GROUP_RATE,
+        max_retries: int = OUT_MAX_RETRIES,
+    ) -> None:
+        self._global = TokenBucket(global_rate)
+        self._private_rate = private_rate
+        self._group_rate = group_rate
+        self._max_retries = max_retries
+        self._chats = {}
+        self._lanes = [Lane() for _ in LANES]
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def initialize(self) -> None:
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict | list[dict]:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        priority = rate_limit_args if rate_limit_args in LANES else PRIORITY_INTERACTIVE
+        key = str(chat_id)
+        bucket = self._chat_bucket(key)
+        attempt = 0
+        while True:
+            await self._wait_turn(key, bucket, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self._max_retries:
+                    raise
+                attempt += 1
+                logger.warning(
+                    f"Flood limit hit by '{endpoint}' to '{chat_id}', all requests"
+                    f" wait {e.retry_after} s (attempt {attempt})"
+                )
+                self._global.pause(e.retry_after)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        """Returns bucket of chat, creating it with limit depending on type of chat"""
+
+        key = str(chat_id)
+        if key not in self._chats:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {
+                    chat: bucket for chat, bucket in self._chats.items() if not bucket.idle
+                }
+            # Ids of groups are negative, channels could be given by @username
+            if key.startswith(("-", "@")):
+                self._chats[key] = TokenBucket(self._group_rate, 60)
+            else:
+                self._chats[key] = TokenBucket(self._private_rate)
+        return self._chats[key]
+
+    async def _wait_turn(self, key: str, bucket: TokenBucket, priority: int) -> None:
+        """Waits in lane of given priority until queue lets request through"""
+
+        turn = asyncio.get_running_loop().create_future()
+        self._lanes[priority].add(key, bucket, turn)
+        self._wakeup.set()
+        await turn
+
+    def _next_turn(self) -> tuple[Lane | None, float | None]:
+        """
+        Finds lane which has a request with token of its chat,
+        looking through lanes from the most important one.
+        If there is no such request returns how long to wait for the nearest
+        token of chat (None if queue is empty).
+        """
+
+        wait = None
+        for lane in self._lanes:
+            key, delay = lane.peek()
+            if key is not None:
+                return lane, None
+            if delay is not None:
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _dispatch(self) -> None:
+        """
+        Lets waiting requests through one by one at global rate,
+        first one of the most important lane goes first.
+        """
+
+        while True:
+            found, wait = self._next_turn()
+            if found is None:
+                # Wait for new request or for token of chat
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.delay()
+            if delay > 0:
+                # Request of more important lane could come meanwhile
+                await asyncio.sleep(delay)
+                continue
+
+            turn = found.pop()
+            self._global.take()
+            turn.set_result(None)
@@ -0,0 +1,211 @@
+"""
+Asynchronous access to data for bot handlers.
+Pymongo is blocking, so every database call made from a handler or a job
+is executed in a dedicated thread pool instead of the event loop.
+This way one slow round trip to Mongo doesn't stall other users.
+Calls go through circuit breaker (see health.py): when database is down
+they fail fast with CircuitOpenError instead of waiting for timeouts.
+"""
+
+import asyncio
+import functools
+import helpers
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from health import DB_HEALTH, DB_HEALTH_INTERVAL, CircuitOpenError
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import ConnectionFailure, PyMongoError
+from telegram import User
+from typing import Any, Awaitable, Callable, TypeVar
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+T = TypeVar("T")
+
+# Pymongo client is thread-safe and has its own connection pool,
+# so number of workers just limits how many queries are in flight at once
+DB_THREADS = int(os.environ.get("DB_THREADS", 8))
+EXECUTOR = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+# How often users seen in group chats are written to staff collection (seconds)
+STAFF_FLUSH_INTERVAL = float(os.environ.get("STAFF_FLUSH_INTERVAL", 5))
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs given blocking function (database call) in a thread pool
+    and returns its result without blocking the event loop.
+    Exceptions are passed to calling side as is.
+    Raises CircuitOpenError without calling function if database is down.
+    """
+
+    if not DB_HEALTH.allow():
+        raise CircuitOpenError(f"Database is unavailable: {DB_HEALTH.last_error}")
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            EXECUTOR, functools.partial(func, *args, **kwargs)
+        )
+    except ConnectionFailure as e:
+        DB_HEALTH.record_failure(e)
+        raise
+    else:
+        DB_HEALTH.record_success()
+        return result
+
+
+async def monitor_db(db: Database, interval: int = DB_HEALTH_INTERVAL) -> None:
+    """
+    Pings database every interval (in seconds) until cancelled,
+    so handlers know its state and latency without pinging it themselves.
+    Ping bypasses circuit breaker, because it's the way to learn
+    that database is back.
+    """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(EXECUTOR, DB_HEALTH.check, db)
+        logger.debug(f"Database health: {DB_HEALTH.status()}")
+        await asyncio.sleep(interval)
+
+
+def offload(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """
+    Makes awaitable version of given blocking helper.
+    Signature and docstring of original helper are preserved.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        return await run_db(func, *args, **kwargs)
+
+    return wrapper
+
+
+class StaffEnrichmentQueue:
+    """
+    Buffer of users seen in group chats, whose info (telegram id and name)
+    should be added to staff collection. Handlers only put users here,
+    and buffer is written by enrich_staff every STAFF_FLUSH_INTERVAL seconds
+    with one bulk operation. Users whose staff records are complete are not
+    buffered again while bot is running (and enrich_staff skips them after restart),
+    others are checked every time they are seen (they could be imported meanwhile).
+    Used from event loop only, so no locks needed.
+    """
+
+    def __init__(self) -> None:
+        self._pending = {}
+        self._known = set()
+
+    def add(self, user: User) -> None:
+        """Remembers user to write on next flush (if not written already)"""
+
+        tg_id = str(user.id)
+        if not user.username or tg_id in self._known or tg_id in self._pending:
+            return
+        self._pending[tg_id] = {
+            "tg_id": tg_id,
+            "tg_username": user.username,
+            "name": user.first_name or user.name,
+        }
+
+    async def flush(self, db: Database) -> int:
+        """
+        Writes buffered users to database. If it fails, they are kept
+        for next flush. Returns number of updated staff records.
+        """
+
+        if not self._pending:
+            return 0
+
+        users, self._pending = self._pending, {}
+        try:
+            updated, known = await run_db(
+                helpers.enrich_staff, list(users.values()), db
+            )
+        except PyMongoError as e:
+            logger.error(f"Couldn't add info of users from group chats to DB: {e}")
+            self._pending = users | self._pending
+            return 0
+        self._known.update(known)
+        if updated:
+            logger.debug(f"Info of {updated} users from group chats added to DB")
+        return updated
+
+    async def run(self, db: Database, interval: float = STAFF_FLUSH_INTERVAL) -> None:
+        """Flushes buffer every interval (in seconds) until cancelled"""
+
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush(db)
+
+
+STAFF_QUEUE = StaffEnrichmentQueue()
+
+
+def _find_all(collection: Collection, *args: Any, **kwargs: Any) -> list[dict]:
+    """
+    Blocking helper to get all documents found in given collection.
+    Cursor is exhausted right here, so no lazy reads happen on the event loop.
+    """
+    return list(collection.find(*args, **kwargs))
+
+
+# Awaitable versions of helpers which access database
+activate_project = offload(helpers.activate_project)
+add_project = offload(helpers.add_project)
+add_user_id_to_db = offload(helpers.add_user_id_to_db)
+add_user_info_to_db = offload(helpers.add_user_info_to_db)
+add_worker_info_to_staff = offload(helpers.add_worker_info_to_staff)
+attach_tasks = offload(helpers.attach_tasks)
+build_participation = offload(helpers.build_participation)
+claim_reminder_minutes = offload(helpers.claim_reminder_minutes)
+complete_task = offload(helpers.complete_task)
+delete_participation = offload(helpers.delete_participation)
+delete_tasks = offload(helpers.delete_tasks)
+enrich_staff = offload(helpers.enrich_staff)
+ensure_indexes = offload(helpers.ensure_indexes)
+forget_delivery = offload(helpers.forget_delivery)
+get_active_project = offload(helpers.get_active_project)
+get_actioner_projects_filter = offload(helpers.get_actioner_projects_filter)
+get_assignees = offload(helpers.get_assignees)
+get_deliveries = offload(helpers.get_deliveries)
+get_due_reminders = offload(helpers.get_due_reminders)
+get_keyboard_and_msg = offload(helpers.get_keyboard_and_msg)
+get_message_and_button_for_task = offload(helpers.get_message_and_button_for_task)
+get_participation = offload(helpers.get_participation)
+get_project_actioners = offload(helpers.get_project_actioners)
+get_project_by_title = offload(helpers.get_project_by_title)
+get_project_team = offload(helpers.get_project_team)
+get_projects_and_pms_for_user = offload(helpers.get_projects_and_pms_for_user)
+get_staff_by_oids = offload(helpers.get_staff_by_oids)
+get_status_on_project = offload(helpers.get_status_on_project)
+get_tasks_to_report = offload(helpers.get_tasks_to_report)
+get_worker_oid_from_db_by_tg_id = offload(helpers.get_worker_oid_from_db_by_tg_id)
+get_worker_oid_from_db_by_tg_username = offload(
+    helpers.get_worker_oid_from_db_by_tg_username
+)
+get_worker_tg_id_from_db_by_tg_username = offload(
+    helpers.get_worker_tg_id_from_db_by_tg_username
+)
+get_worker_tg_username_by_oid = offload(helpers.get_worker_tg_username_by_oid)
+get_worker_tg_username_by_tg_id = offload(helpers.get_worker_tg_username_by_tg_id)
+index_participation = offload(helpers.index_participation)
+migrate_reminders = offload(helpers.migrate_reminders)
+modify_project = offload(helpers.modify_project)
+record_delivery = offload(helpers.record_delivery)
+refresh_next_events = offload(helpers.refresh_next_events)
+save_tasks = offload(helpers.save_tasks)
+spread_reminders = offload(helpers.spread_reminders)
+update_reminder = offload(helpers.update_reminder)
+update_tasks = offload(helpers.update_tasks)
+find_all = offload(_find_all)
@@ -0,0 +1,152 @@
+"""
+Storage backends of the bot, selected at startup by DB_BACKEND setting:
+'mongo' (default) - MongoDB server, data and jobs survive restarts;
+'memory' - in-process database with the same pymongo interface (mongomock),
+for benchmarks and simulation loads without a database process.
+Everything is lost on stop, jobs are kept in memory too.
+Backend only provides connection, job store and cache watcher:
+helpers and handlers call pymongo Database returned by connect() directly,
+so any backend has to give database with pymongo interface.
+"""
+
+import logging
+import os
+
+from apscheduler.jobstores.base import BaseJobStore
+from dotenv import load_dotenv
+from health import DB_HEALTH
+from helpers import DB_NAME, TASKS_IN_COLLECTION, get_db, get_mongo_client
+from ptbcontrib.ptb_jobstores import PTBMongoDBJobStore
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from telegram.ext import Application
+from watcher import CacheWatcher, start_cache_watcher
+
+# Optional dependency: needed only for 'memory' backend
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+DB_BACKEND = os.environ.get("DB_BACKEND", "mongo")
+
+
+class TolerantMongoDBJobStore(PTBMongoDBJobStore):
+    """
+    Job store which lets bot start while database is unavailable.
+    Index for jobs is created on start and failure here would stop scheduler.
+    Later reads of due jobs are retried by scheduler itself.
+    """
+
+    def start(self, scheduler, alias) -> None:
+        try:
+            super().start(scheduler, alias)
+        except PyMongoError as e:
+            logger.error(f"Job store started without database: {e}")
+
+
+class Storage:
+    """
+    Interface of storage backend: how to connect to database, where to keep jobs
+    and how to sync caches. It's not an abstraction of data access,
+    queries are made by helpers with pymongo API of returned database.
+    """
+
+    name = ""
+
+    def connect(self) -> Database:
+        """Returns database for helpers and handlers"""
+        raise NotImplementedError
+
+    def job_store(self, application: Application, db: Database) -> BaseJobStore | None:
+        """
+        Returns store for jobs of given application (connected database is given)
+        or None if jobs should be kept in memory (default store of scheduler).
+        """
+        return None
+
+    def cache_watcher(self, db: Database) -> CacheWatcher | None:
+        """
+        Starts watcher which keeps caches in sync with changes made
+        by other instances of bot (None if database can't be shared).
+        """
+        return None
+
+
+class MongoStorage(Storage):
+    """
+    MongoDB server. If it's unreachable at start, bot starts in degraded mode:
+    circuit breaker is open, so handlers tell users that database is unavailable,
+    and health monitor closes it as soon as server answers.
+    """
+
+    name = "mongo"
+
+    def connect(self) -> Database:
+        # Client (and its pool of connections) is shared by data layer and job store
+        client = get_mongo_client()
+        try:
+            return get_db(client)
+        except ConnectionError as e:
+            logger.error(f"Couldn't connect to DB, starting in degraded mode: {e}")
+            DB_HEALTH.mark_unavailable(e)
+            return client[DB_NAME]
+
+    def job_store(self, application: Application, db: Database) -> BaseJobStore | None:
+        return TolerantMongoDBJobStore(application=application, client=db.client)
+
+    def cache_watcher(self, db: Database) -> CacheWatcher | None:
+        return start_cache_watcher(db)
+
+
+class MemoryStorage(Storage):
+    """
+    In-memory database with pymongo interface.
+    Update pipelines and positional updates of arrays used for tasks inside
+    project document are evaluated wrong by mongomock (tasks get lost),
+    so this backend requires tasks in their own collection (TASKS_STORAGE=collection)
+    and doesn't support default 'embedded' mode.
+    Raises ImportError if mongomock is not installed,
+    ValueError if tasks are stored inside projects.
+    """
+
+    name = "memory"
+
+    def connect(self) -> Database:
+        if mongomock is None:
+            raise ImportError(
+                "'memory' storage backend requires mongomock, install it with"
+                " 'pip install mongomock' (see requirements.txt)"
+            )
+        if not TASKS_IN_COLLECTION:
+            raise ValueError(
+                "'memory' storage backend requires TASKS_STORAGE=collection,"
+                " default 'embedded' mode is not supported"
+            )
+        return mongomock.MongoClient()[DB_NAME]
+
+
+BACKENDS = {
+    MongoStorage.name: MongoStorage,
+    MemoryStorage.name: MemoryStorage,
+}
+
+
+def get_storage(name: str = "") -> Storage:
+    """
+    Returns storage backend by its name (DB_BACKEND setting if name is not given).
+    Raises ValueError for unknown backend.
+    """
+
+    name = name or DB_BACKEND
+    if name not in BACKENDS.keys():
+        raise ValueError(
+            f"Unknown storage backend '{name}', choose one of: {', '.join(BACKENDS)}"
+        )
+    return BACKENDS[name]()
@@ -0,0 +1,105 @@
+"""
+Tests of claiming minutes by dispatcher of reminders:
+missed minutes are caught up and every minute is handled only once.
+"""
+
+import logging
+import mongomock
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from helpers import REMINDER_CATCH_UP, claim_reminder_minutes
+
+START = datetime(2024, 5, 6, 10, 0)
+# Clock of Central Europe before and after daylight saving time changes
+WINTER = timezone(timedelta(hours=1))
+SUMMER = timezone(timedelta(hours=2))
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def test_first_run_claims_current_minute(db):
+    assert claim_reminder_minutes(START, db) == [START]
+
+
+def test_seconds_are_dropped(db):
+    assert claim_reminder_minutes(START.replace(second=42, microsecond=7), db) == [START]
+
+
+def test_minute_is_claimed_once(db):
+    claim_reminder_minutes(START, db)
+
+    assert claim_reminder_minutes(START, db) == []
+    assert claim_reminder_minutes(START + timedelta(seconds=30), db) == []
+
+
+def test_next_minute_is_claimed(db):
+    claim_reminder_minutes(START, db)
+
+    assert claim_reminder_minutes(START + timedelta(minutes=1), db) == [
+        START + timedelta(minutes=1)
+    ]
+
+
+def test_missed_minutes_are_caught_up(db):
+    claim_reminder_minutes(START, db)
+
+    assert claim_reminder_minutes(START + timedelta(minutes=3), db) == [
+        START + timedelta(minutes=1),
+        START + timedelta(minutes=2),
+        START + timedelta(minutes=3),
+    ]
+
+
+def test_catch_up_is_limited(db, caplog):
+    claim_reminder_minutes(START, db)
+    now = START + timedelta(minutes=REMINDER_CATCH_UP + 10)
+
+    with caplog.at_level(logging.WARNING):
+        minutes = claim_reminder_minutes(now, db)
+
+    assert minutes[0] == now - timedelta(minutes=REMINDER_CATCH_UP)
+    assert minutes[-1] == now
+    assert len(minutes) == REMINDER_CATCH_UP + 1
+    # Every dropped minute is named
+    assert "9 missed minutes are dropped" in caplog.text
+    assert f"{START + timedelta(minutes=1):%Y-%m-%d %H:%M}" in caplog.text
+    assert f"{minutes[0] - timedelta(minutes=1):%Y-%m-%d %H:%M}" in caplog.text
+
+
+def test_clock_set_forward_catches_up_skipped_minutes(db, caplog):
+    claim_reminder_minutes(datetime(2024, 3, 31, 1, 59, tzinfo=WINTER), db)
+
+    with caplog.at_level(logging.WARNING):
+        minutes = claim_reminder_minutes(datetime(2024, 3, 31, 3, 0, tzinfo=SUMMER), db)
+
+    # Only a minute has passed, so the whole skipped hour is handled
+    assert minutes[0] == datetime(2024, 3, 31, 2, 0)
+    assert minutes[-1] == datetime(2024, 3, 31, 3, 0)
+    assert len(minutes) == 61
+    assert "dropped" not in caplog.text
+
+
+def test_clock_set_back_does_not_repeat_minutes(db, caplog):
+    claim_reminder_minutes(datetime(2024, 10, 27, 2, 59, tzinfo=SUMMER), db)
+
+    # Repeated hour is skipped
+    for minute in range(60):
+        moment = datetime(2024, 10, 27, 2, minute, tzinfo=WINTER)
+        assert claim_reminder_minutes(moment, db) == []
+
+    # Hour of real time passed, but no minute of wall clock is missed
+    with caplog.at_level(logging.WARNING):
+        minutes = claim_reminder_minutes(datetime(2024, 10, 27, 3, 0, tzinfo=WINTER), db)
+
+    assert minutes == [datetime(2024, 10, 27, 3, 0)]
+    assert "dropped" not in caplog.text
+
+
+def test_earlier_minute_is_not_claimed(db):
+    claim_reminder_minutes(START, db)
+
+    assert claim_reminder_minutes(START - timedelta(minutes=1), db) == []
@@ -0,0 +1,83 @@
+"""
+Tests of delivery ledger: reminder run repeated the same day
+sends only messages which weren't delivered before.
+"""
+
+import asyncio
+import mongomock
+import pytest
+
+from bson import ObjectId
+from datetime import date
+from fanout import DeliveryLedger, FanOut
+from telegram.error import NetworkError
+
+DAY = date(2024, 5, 6)
+
+
+class Bot:
+    """Records sent messages, fails to send given texts"""
+
+    def __init__(self, broken: tuple[str, ...] = ()) -> None:
+        self.broken = broken
+        self.sent = []
+
+    async def send_message(self, chat_id: str, text: str, **kwargs) -> None:
+        if text in self.broken:
+            raise NetworkError("timed out")
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def run(bot: Bot, db, project_id: ObjectId, kind: str = "morning_update", day=DAY) -> dict:
+    fanout = FanOut(bot, ledger=DeliveryLedger(db, project_id, kind, day))
+    fanout.add("1", "header")
+    fanout.add("1", "task")
+    fanout.add("2", "task")
+    return asyncio.run(fanout.send())
+
+
+def test_run_resumes_after_failure(db):
+    project_id = ObjectId()
+    first = Bot(broken=("task",))
+
+    result = run(first, db, project_id)
+
+    assert first.sent == [("1", "header")]
+    assert result["failed"] == 2
+
+    # Next run of the same day sends only what wasn't delivered
+    second = Bot()
+    result = run(second, db, project_id)
+
+    assert sorted(second.sent) == [("1", "task"), ("2", "task")]
+    assert result["already_sent"] == 1
+    assert result["sent"] == 2
+
+
+def test_finished_run_is_not_repeated(db):
+    project_id = ObjectId()
+    run(Bot(), db, project_id)
+
+    bot = Bot()
+    result = run(bot, db, project_id)
+
+    assert bot.sent == []
+    assert result["already_sent"] == 3
+
+
+def test_other_reminder_and_day_are_sent(db):
+    project_id = ObjectId()
+    run(Bot(), db, project_id)
+
+    other_kind = Bot()
+    run(other_kind, db, project_id, kind="day_before_update")
+    next_day = Bot()
+    run(next_day, db, project_id, day=date(2024, 5, 7))
+
+    assert len(other_kind.sent) == 3
+    assert len(next_day.sent) == 3
@@ -0,0 +1,69 @@
+"""
+Tests of comparison of stored tasks with uploaded ones,
+which decides what is written to DB on /upload.
+"""
+
+from helpers import diff_tasks
+
+
+def make_task(task_id: int, **fields) -> dict:
+    task = {"id": task_id, "name": f"Task {task_id}", "complete": 0, "actioners": []}
+    task.update(fields)
+    return task
+
+
+def test_new_task_is_inserted():
+    new = make_task(2)
+    changes = diff_tasks([make_task(1)], [make_task(1), new])
+
+    assert changes["inserted"] == [new]
+    assert changes["deleted"] == []
+    assert changes["updated"] == {}
+
+
+def test_missing_task_is_deleted():
+    changes = diff_tasks([make_task(1), make_task(2)], [make_task(1)])
+
+    assert changes["inserted"] == []
+    assert changes["deleted"] == [2]
+    assert changes["updated"] == {}
+
+
+def test_only_changed_fields_are_updated():
+    changes = diff_tasks(
+        [make_task(1), make_task(2)],
+        [make_task(1, name="Renamed", complete=50), make_task(2)],
+    )
+
+    assert changes["updated"] == {1: {"name": "Renamed", "complete": 50}}
+    assert changes["kept_complete"] == []
+
+
+def test_ids_of_db_documents_are_not_compared():
+    stored = make_task(1, _id="stored", project_id="project")
+    changes = diff_tasks([stored], [make_task(1, _id="new", project_id="other")])
+
+    assert changes["updated"] == {}
+
+
+def test_completeness_set_in_bot_is_kept():
+    changes = diff_tasks(
+        [make_task(1, complete=100)], [make_task(1, name="Renamed", complete=30)]
+    )
+
+    assert changes["updated"] == {1: {"name": "Renamed"}}
+    assert changes["kept_complete"] == [1]
+
+
+def test_kept_completeness_alone_is_no_update():
+    changes = diff_tasks([make_task(1, complete=100)], [make_task(1, complete=None)])
+
+    assert changes["updated"] == {}
+    assert changes["kept_complete"] == [1]
+
+
+def test_higher_completeness_from_file_wins():
+    changes = diff_tasks([make_task(1, complete=30)], [make_task(1, complete=100)])
+
+    assert changes["updated"] == {1: {"complete": 100}}
+    assert changes["kept_complete"] == []
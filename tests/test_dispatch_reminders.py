@@ -0,0 +1,117 @@
+"""
+Tests of dispatcher of reminders: long runs go in background,
+so ticks of the following minutes are not lost.
+"""
+
+import asyncio
+import mongomock
+import pytest
+
+# Job store of reminders is installed from git (see requirements.txt)
+pytest.importorskip("ptbcontrib")
+
+import app  # noqa: E402
+
+from datetime import datetime, timedelta  # noqa: E402
+from helpers import get_reminder_slot  # noqa: E402
+
+START = datetime(2024, 5, 6, 10, 0)
+
+
+class Clock:
+    """Replaces datetime in app, so dispatcher sees given moment as now"""
+
+    moment = START
+
+    @classmethod
+    def now(cls, tz=None) -> datetime:
+        return cls.moment
+
+
+class Application:
+    def __init__(self) -> None:
+        self.tasks = []
+
+    def create_task(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+
+class Context:
+    def __init__(self) -> None:
+        self.application = Application()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().db
+    for minute, title in enumerate(("First", "Second", "Third")):
+        db.projects.insert_one(
+            {
+                "title": title,
+                "pm_tg_id": "1",
+                "reminder_slots": [
+                    {
+                        "kind": "morning_update",
+                        "at": get_reminder_slot(START + timedelta(minutes=minute)),
+                    }
+                ],
+            }
+        )
+    monkeypatch.setattr(app, "DB", db)
+    monkeypatch.setattr(app, "datetime", Clock)
+    return db
+
+
+def test_run_spanning_several_minutes_does_not_block_next_ticks(db, monkeypatch):
+    sent = []
+
+    async def run() -> Context:
+        release = asyncio.Event()
+
+        async def slow_reminder(context, data) -> None:
+            # First run lasts until all three minutes were dispatched
+            if data["project_title"] == "First":
+                await release.wait()
+            sent.append(data["project_title"])
+
+        monkeypatch.setattr(app, "morning_update", slow_reminder)
+        context = Context()
+        for minute in range(3):
+            Clock.moment = START + timedelta(minutes=minute)
+            # Every tick returns while the first run still goes on
+            await asyncio.wait_for(app.dispatch_reminders(context), 1)
+        assert sent == ["Second", "Third"]
+        release.set()
+        await asyncio.gather(*context.application.tasks)
+        return context
+
+    context = asyncio.run(run())
+
+    assert len(context.application.tasks) == 3
+    assert sorted(sent) == ["First", "Second", "Third"]
+    Clock.moment = START
+
+
+def test_failed_reminder_does_not_stop_others(db, monkeypatch, caplog):
+    sent = []
+
+    async def reminder(context, data) -> None:
+        if data["project_title"] == "First":
+            raise RuntimeError("broken")
+        sent.append(data["project_title"])
+
+    monkeypatch.setattr(app, "morning_update", reminder)
+
+    async def run() -> None:
+        context = Context()
+        Clock.moment = START + timedelta(minutes=2)
+        await app.dispatch_reminders(context)
+        await asyncio.gather(*context.application.tasks)
+
+    asyncio.run(run())
+
+    # Dispatcher runs first time, so only its minute is due
+    assert sent == ["Third"]
+    Clock.moment = START
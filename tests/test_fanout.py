@@ -0,0 +1,77 @@
+"""
+Tests of sending messages of reminder run: recipients are served concurrently,
+failure of one recipient doesn't stop others.
+"""
+
+import asyncio
+import logging
+
+from fanout import FanOut
+from telegram.error import Forbidden, NetworkError
+
+
+class Bot:
+    """Records sent messages, raises errors given for recipients"""
+
+    def __init__(self, errors: dict | None = None) -> None:
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id: str, text: str, **kwargs) -> None:
+        error = self.errors.get(chat_id)
+        if error:
+            raise error
+        self.sent.append((chat_id, text))
+
+
+def send(bot: Bot, messages: list[tuple[str, str]]) -> dict:
+    fanout = FanOut(bot)
+    for chat_id, text in messages:
+        fanout.add(chat_id, text)
+    return asyncio.run(fanout.send())
+
+
+def test_messages_of_recipient_keep_order():
+    bot = Bot()
+
+    result = send(bot, [("1", "header"), ("2", "other"), ("1", "task")])
+
+    assert [text for chat_id, text in bot.sent if chat_id == "1"] == ["header", "task"]
+    assert result["sent"] == 3
+
+
+def test_unreachable_recipient_is_skipped():
+    bot = Bot({"1": Forbidden("bot was blocked by the user")})
+
+    result = send(bot, [("1", "header"), ("1", "task"), ("2", "other")])
+
+    assert bot.sent == [("2", "other")]
+    assert result == {"sent": 1, "failed": 1, "skipped": 1, "already_sent": 0}
+
+
+def test_telegram_error_does_not_stop_recipient():
+    class FlakyBot(Bot):
+        async def send_message(self, chat_id: str, text: str, **kwargs) -> None:
+            if text == "broken":
+                raise NetworkError("timed out")
+            await super().send_message(chat_id, text)
+
+    bot = FlakyBot()
+
+    result = send(bot, [("1", "broken"), ("1", "task")])
+
+    assert bot.sent == [("1", "task")]
+    assert result["failed"] == 1
+    assert result["sent"] == 1
+
+
+def test_unexpected_error_stops_only_its_recipient(caplog):
+    bot = Bot({"1": KeyError("title")})
+
+    with caplog.at_level(logging.ERROR):
+        result = send(bot, [("1", "header"), ("1", "task"), ("2", "other")])
+
+    assert bot.sent == [("2", "other")]
+    # Both messages of recipient weren't delivered
+    assert result == {"sent": 1, "failed": 2, "skipped": 0, "already_sent": 0}
+    assert "Sending messages to '1' stopped by error" in caplog.text
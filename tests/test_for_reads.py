@@ -0,0 +1,43 @@
+"""
+Tests of read preference of helpers which only read data.
+Settings are read on import, so module is imported by separate interpreter.
+"""
+
+import os
+import subprocess
+import sys
+
+from pathlib import Path
+
+CHECK = """
+import helpers, mongomock
+db = mongomock.MongoClient().db
+for _ in range(3):
+    assert helpers.for_reads(db) is db
+print(helpers.READ_PREFERENCE, helpers.MAX_STALENESS)
+"""
+
+
+def run_with(**settings) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", CHECK],
+        cwd=Path(__file__).parent.parent,
+        env=dict(os.environ, **settings),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_unknown_read_preference_is_reported_once():
+    result = run_with(MONGO_READ_PREFERENCE="secondaryPrefered")
+
+    assert result.stdout.split()[0] == "primary"
+    assert result.stderr.count("Unknown read preference 'secondaryPrefered'") == 1
+
+
+def test_too_small_staleness_is_not_limited():
+    result = run_with(MONGO_READ_PREFERENCE="primary", MONGO_MAX_STALENESS_S="30")
+
+    assert result.stdout.split() == ["primary", "-1"]
+    assert result.stderr.count("less than 90 s") == 1
@@ -0,0 +1,72 @@
+"""
+Tests of resolving active project of PM: one project is always active,
+and pointer to it is cached.
+"""
+
+import mongomock
+import pytest
+
+from cache import ACTIVE_PROJECT_CACHE
+from helpers import get_active_project
+
+
+@pytest.fixture
+def db():
+    ACTIVE_PROJECT_CACHE.clear()
+    yield mongomock.MongoClient().db
+    ACTIVE_PROJECT_CACHE.clear()
+
+
+def add_project(db, title: str, pm_tg_id: str = "1", active: bool = False):
+    return db.projects.insert_one(
+        {"title": title, "pm_tg_id": pm_tg_id, "active": active, "revision": 1}
+    ).inserted_id
+
+
+def test_active_project_is_returned_and_cached(db):
+    add_project(db, "Old")
+    oid = add_project(db, "Active", active=True)
+
+    project = get_active_project("1", db)
+
+    assert project["_id"] == str(oid)
+    assert ACTIVE_PROJECT_CACHE.get("1") == oid
+
+
+def test_oldest_project_is_activated_if_none_is_active(db):
+    oldest = add_project(db, "Oldest")
+    add_project(db, "Newer")
+
+    project = get_active_project("1", db)
+
+    assert project["_id"] == str(oldest)
+    assert db.projects.count_documents({"pm_tg_id": "1", "active": True}) == 1
+
+
+def test_only_one_project_stays_active(db):
+    first = add_project(db, "First", active=True)
+    second = add_project(db, "Second", active=True)
+
+    project = get_active_project("1", db)
+
+    assert project["_id"] == str(first)
+    assert db.projects.find_one({"_id": second})["active"] is False
+
+
+def test_stale_pointer_is_checked(db):
+    first = add_project(db, "First", active=True)
+    second = add_project(db, "Second")
+    get_active_project("1", db)
+
+    # Other instance of bot switched projects
+    db.projects.update_one({"_id": first}, {"$set": {"active": False}})
+    db.projects.update_one({"_id": second}, {"$set": {"active": True}})
+
+    assert get_active_project("1", db)["_id"] == str(second)
+
+
+def test_pm_without_projects_gets_nothing(db):
+    add_project(db, "Other", pm_tg_id="2")
+
+    assert get_active_project("1", db) == {}
+    assert ACTIVE_PROJECT_CACHE.get("1") is None
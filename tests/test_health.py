@@ -0,0 +1,88 @@
+"""
+Tests of circuit breaker around the database.
+"""
+
+import mongomock
+import time
+
+from health import CLOSED, HALF_OPEN, OPEN, DBHealth
+from pymongo.errors import ServerSelectionTimeoutError
+
+
+def open_circuit(health: DBHealth) -> None:
+    for _ in range(2):
+        health.record_failure(ServerSelectionTimeoutError("no servers"))
+
+
+def test_circuit_opens_after_failures_in_a_row():
+    health = DBHealth(failure_threshold=2, reset_timeout=60)
+
+    health.record_failure(ServerSelectionTimeoutError("no servers"))
+    assert health.allow()
+    health.record_failure(ServerSelectionTimeoutError("no servers"))
+
+    assert health.state == OPEN
+    assert not health.available
+    assert not health.allow()
+
+
+def test_success_resets_count_of_failures():
+    health = DBHealth(failure_threshold=2, reset_timeout=60)
+
+    health.record_failure(ServerSelectionTimeoutError("no servers"))
+    health.record_success()
+    health.record_failure(ServerSelectionTimeoutError("no servers"))
+
+    assert health.state == CLOSED
+
+
+def test_only_one_trial_call_in_half_open_state():
+    health = DBHealth(failure_threshold=2, reset_timeout=0.05)
+    open_circuit(health)
+    time.sleep(0.06)
+
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    assert not health.allow()
+    assert not health.allow()
+
+    health.record_success()
+
+    assert health.state == CLOSED
+    assert health.allow()
+
+
+def test_failed_trial_opens_circuit_again():
+    health = DBHealth(failure_threshold=2, reset_timeout=0.05)
+    open_circuit(health)
+    time.sleep(0.06)
+
+    assert health.allow()
+    health.record_failure(ServerSelectionTimeoutError("no servers"))
+
+    assert health.state == OPEN
+    assert not health.allow()
+
+
+def test_trial_without_result_is_repeated_after_timeout():
+    health = DBHealth(failure_threshold=2, reset_timeout=0.05)
+    open_circuit(health)
+    time.sleep(0.06)
+    assert health.allow()
+
+    # Trial call failed with other error and recorded nothing
+    time.sleep(0.06)
+
+    assert health.allow()
+    assert not health.allow()
+
+
+def test_ping_closes_circuit():
+    health = DBHealth(failure_threshold=2, reset_timeout=60)
+    health.mark_unavailable(ServerSelectionTimeoutError("no servers"))
+    assert health.state == OPEN
+
+    assert health.check(mongomock.MongoClient().db)
+
+    assert health.state == CLOSED
+    assert health.status()["latency_ms"] is not None
@@ -0,0 +1,111 @@
+"""
+Tests of optimistic concurrency of writes to projects:
+write is made only if revision of project didn't change since it was read.
+"""
+
+import logging
+import mongomock
+import pytest
+
+from bson import ObjectId
+from cache import ACTIVE_PROJECT_CACHE
+from helpers import REVISION_RETRIES, activate_project, modify_project
+
+
+@pytest.fixture
+def db():
+    ACTIVE_PROJECT_CACHE.clear()
+    yield mongomock.MongoClient().db
+    ACTIVE_PROJECT_CACHE.clear()
+
+
+def add_project(db, title: str, pm_tg_id: str = "1", **fields) -> ObjectId:
+    project = {"title": title, "pm_tg_id": pm_tg_id, "active": False, "revision": 1}
+    project.update(fields)
+    return db.projects.insert_one(project).inserted_id
+
+
+def test_update_increments_revision(db):
+    oid = add_project(db, "Project")
+
+    project = modify_project(oid, lambda project: {"$set": {"title": "Renamed"}}, db)
+
+    assert project["title"] == "Renamed"
+    assert project["revision"] == 2
+
+
+def test_nothing_to_change_returns_project_as_read(db):
+    oid = add_project(db, "Project")
+
+    project = modify_project(oid, lambda project: None, db)
+
+    assert project["revision"] == 1
+
+
+def test_missing_project_returns_none(db):
+    assert modify_project(ObjectId(), lambda project: {"$set": {"x": 1}}, db) is None
+
+
+def test_concurrent_change_is_read_again(db):
+    oid = add_project(db, "Project", counter=0)
+    calls = []
+
+    def increment(project: dict) -> dict:
+        calls.append(project["counter"])
+        if len(calls) == 1:
+            # Other session writes between read and write of this one
+            db.projects.update_one(
+                {"_id": oid}, {"$set": {"counter": 10}, "$inc": {"revision": 1}}
+            )
+        return {"$set": {"counter": project["counter"] + 1}}
+
+    project = modify_project(oid, increment, db)
+
+    # Change of other session is not lost
+    assert calls == [0, 10]
+    assert project["counter"] == 11
+    assert project["revision"] == 3
+
+
+def test_unresolved_conflicts_return_none(db, caplog):
+    oid = add_project(db, "Project")
+
+    def always_conflicting(project: dict) -> dict:
+        db.projects.update_one({"_id": oid}, {"$inc": {"revision": 1}})
+        return {"$set": {"title": "Renamed"}}
+
+    with caplog.at_level(logging.WARNING):
+        assert modify_project(oid, always_conflicting, db) is None
+
+    assert db.projects.find_one({"_id": oid})["title"] == "Project"
+    assert caplog.text.count("changed concurrently") == REVISION_RETRIES + 1
+
+
+def test_project_saved_without_revision_is_modified(db):
+    oid = db.projects.insert_one({"title": "Old", "pm_tg_id": "1"}).inserted_id
+
+    project = modify_project(oid, lambda project: {"$set": {"title": "Renamed"}}, db)
+
+    assert project["revision"] == 1
+
+
+def test_activation_deactivates_other_projects(db):
+    current = add_project(db, "Current", active=True)
+    chosen = add_project(db, "Chosen")
+
+    project = activate_project(chosen, "1", db)
+
+    assert project["_id"] == str(chosen)
+    assert db.projects.find_one({"_id": current})["active"] is False
+    assert db.projects.count_documents({"pm_tg_id": "1", "active": True}) == 1
+
+
+def test_project_of_other_pm_is_not_activated(db):
+    current = add_project(db, "Current", active=True)
+    # Project was transferred to other PM after menu was shown
+    transferred = add_project(db, "Transferred", pm_tg_id="2")
+
+    project = activate_project(transferred, "1", db)
+
+    assert project["_id"] == str(current)
+    assert db.projects.find_one({"_id": transferred})["active"] is False
@@ -0,0 +1,158 @@
+"""
+Tests of order in which outbound limiter lets requests to Telegram through:
+priority lanes, order within chat and pause after RetryAfter.
+"""
+
+import asyncio
+import time
+
+from outbox import PRIORITY_BULK, PRIORITY_INTERACTIVE, OutboundLimiter
+from telegram.error import RetryAfter
+
+
+async def send_all(limiter: OutboundLimiter, requests: list[tuple]) -> list[str]:
+    """
+    Queues all requests (tag, chat_id, priority) before limiter starts
+    dispatching them, returns tags in order they were sent.
+    """
+
+    sent = []
+
+    async def callback(tag: str) -> bool:
+        sent.append(tag)
+        return True
+
+    tasks = [
+        asyncio.create_task(
+            limiter.process_request(
+                callback, (tag,), {}, "sendMessage", {"chat_id": chat_id}, priority
+            )
+        )
+        for tag, chat_id, priority in requests
+    ]
+    # Let all requests get into queue
+    await asyncio.sleep(0)
+    await limiter.initialize()
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    finally:
+        await limiter.shutdown()
+    return sent
+
+
+def test_interactive_requests_go_before_bulk():
+    limiter = OutboundLimiter(global_rate=1000, private_rate=1000)
+    sent = asyncio.run(
+        send_all(
+            limiter,
+            [
+                ("bulk 1", 1, PRIORITY_BULK),
+                ("bulk 2", 2, PRIORITY_BULK),
+                ("reply 1", 3, None),
+                ("reply 2", 4, PRIORITY_INTERACTIVE),
+            ],
+        )
+    )
+
+    assert sent == ["reply 1", "reply 2", "bulk 1", "bulk 2"]
+
+
+def test_requests_of_one_chat_keep_order():
+    limiter = OutboundLimiter(global_rate=1000, private_rate=1000)
+    sent = asyncio.run(
+        send_all(limiter, [(f"message {i}", 1, PRIORITY_BULK) for i in range(5)])
+    )
+
+    assert sent == [f"message {i}" for i in range(5)]
+
+
+def test_chat_without_token_does_not_block_others():
+    # Second message to chat 1 has to wait a second for a token, others go meanwhile
+    limiter = OutboundLimiter(global_rate=1000, private_rate=1)
+    sent = asyncio.run(
+        send_all(
+            limiter,
+            [
+                ("first to 1", 1, PRIORITY_BULK),
+                ("second to 1", 1, PRIORITY_BULK),
+                ("to 2", 2, PRIORITY_BULK),
+            ],
+        )
+    )
+
+    assert sent == ["first to 1", "to 2", "second to 1"]
+
+
+def test_requests_without_chat_are_not_queued():
+    limiter = OutboundLimiter()
+
+    async def answer() -> bool:
+        return True
+
+    # Limiter is not even started
+    result = asyncio.run(
+        limiter.process_request(answer, (), {}, "answerCallbackQuery", {}, None)
+    )
+
+    assert result is True
+
+
+def test_retry_after_pauses_all_requests():
+    limiter = OutboundLimiter(global_rate=1000, private_rate=1000, max_retries=1)
+    calls = []
+
+    async def flooded() -> bool:
+        calls.append(("flooded", time.monotonic()))
+        if len(calls) == 1:
+            raise RetryAfter(0.3)
+        return True
+
+    async def other() -> bool:
+        calls.append(("other", time.monotonic()))
+        return True
+
+    async def run() -> float:
+        await limiter.initialize()
+        start = time.monotonic()
+        first = asyncio.create_task(
+            limiter.process_request(flooded, (), {}, "sendMessage", {"chat_id": 1}, None)
+        )
+        # Wait for the flood answer, then send to another chat
+        while not calls:
+            await asyncio.sleep(0.01)
+        await limiter.process_request(other, (), {}, "sendMessage", {"chat_id": 2}, None)
+        await first
+        await limiter.shutdown()
+        return start
+
+    start = asyncio.run(run())
+
+    assert sorted(name for name, _ in calls) == ["flooded", "flooded", "other"]
+    # Nothing went through until pause passed, neither repeated request nor other chat
+    assert all(moment - start >= 0.3 for _, moment in calls[1:])
+
+
+def test_retry_after_is_raised_when_retries_are_over():
+    limiter = OutboundLimiter(global_rate=1000, private_rate=1000, max_retries=1)
+    calls = []
+
+    async def flooded() -> bool:
+        calls.append(time.monotonic())
+        raise RetryAfter(0.1)
+
+    async def run() -> None:
+        await limiter.initialize()
+        try:
+            await limiter.process_request(
+                flooded, (), {}, "sendMessage", {"chat_id": 1}, None
+            )
+        finally:
+            await limiter.shutdown()
+
+    try:
+        asyncio.run(run())
+    except RetryAfter:
+        pass
+    else:
+        raise AssertionError("RetryAfter was not raised")
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+"""
+Tests of running database calls in thread pool and circuit breaker around them.
+"""
+
+import asyncio
+import pytest
+import threading
+
+from health import DB_HEALTH, DB_FAILURE_THRESHOLD, CircuitOpenError
+from pymongo.errors import AutoReconnect
+from repository import get_due_reminders, offload, run_db
+
+
+@pytest.fixture(autouse=True)
+def health():
+    DB_HEALTH.record_success()
+    yield DB_HEALTH
+    DB_HEALTH.record_success()
+
+
+def test_call_runs_outside_event_loop_thread():
+    def blocking(value: int) -> tuple[int, str]:
+        return value * 2, threading.current_thread().name
+
+    result, thread = asyncio.run(run_db(blocking, 21))
+
+    assert result == 42
+    assert thread != threading.main_thread().name
+
+
+def test_other_errors_are_passed_as_is_and_not_counted(health):
+    def broken() -> None:
+        raise KeyError("title")
+
+    for _ in range(DB_FAILURE_THRESHOLD):
+        with pytest.raises(KeyError):
+            asyncio.run(run_db(broken))
+
+    assert health.available
+
+
+def test_calls_fail_fast_when_database_is_down(health):
+    calls = []
+
+    def unreachable() -> None:
+        calls.append(1)
+        raise AutoReconnect("connection refused")
+
+    for _ in range(DB_FAILURE_THRESHOLD):
+        with pytest.raises(AutoReconnect):
+            asyncio.run(run_db(unreachable))
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(run_db(unreachable))
+    assert len(calls) == DB_FAILURE_THRESHOLD
+
+
+def test_offloaded_helper_keeps_its_name_and_docstring():
+    def helper(value: int) -> int:
+        """Doubles value"""
+        return value * 2
+
+    wrapper = offload(helper)
+
+    assert asyncio.run(wrapper(2)) == 4
+    assert wrapper.__name__ == "helper"
+    assert wrapper.__doc__ == "Doubles value"
+    assert get_due_reminders.__name__ == "get_due_reminders"
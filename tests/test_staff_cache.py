@@ -0,0 +1,92 @@
+"""
+Tests of cache of staff records: record is read from database once
+and found by any of its keys until it's invalidated.
+"""
+
+import mongomock
+import pytest
+
+from bson import ObjectId
+from cache import STAFF_CACHE, StaffCache
+from helpers import find_worker
+
+
+def make_record(**fields) -> dict:
+    record = {"_id": ObjectId(), "tg_id": "111", "tg_username": "alice", "name": "Alice"}
+    record.update(fields)
+    return record
+
+
+def test_record_is_found_by_every_key():
+    cache = StaffCache(maxsize=10, ttl=60)
+    record = make_record()
+    cache.put(record)
+
+    assert cache.get("_id", record["_id"]) == record
+    assert cache.get("tg_id", "111") == record
+    assert cache.get("tg_username", "alice") == record
+
+
+def test_returned_record_is_a_copy():
+    cache = StaffCache(maxsize=10, ttl=60)
+    cache.put(make_record())
+
+    cache.get("tg_id", "111")["name"] = "Changed"
+
+    assert cache.get("tg_id", "111")["name"] == "Alice"
+
+
+def test_invalidated_record_is_forgotten_by_every_key():
+    cache = StaffCache(maxsize=10, ttl=60)
+    record = make_record()
+    cache.put(record)
+
+    cache.invalidate(tg_username="alice")
+
+    assert cache.get("_id", record["_id"]) is None
+    assert cache.get("tg_id", "111") is None
+
+
+def test_changed_key_does_not_find_old_record():
+    cache = StaffCache(maxsize=10, ttl=60)
+    record = make_record()
+    cache.put(record)
+
+    cache.put(dict(record, tg_username="alice_new"))
+
+    assert cache.get("tg_username", "alice") is None
+    assert cache.get("tg_username", "alice_new")["_id"] == record["_id"]
+
+
+def test_evicted_record_is_not_returned():
+    cache = StaffCache(maxsize=1, ttl=60)
+    cache.put(make_record())
+    cache.put(make_record(tg_id="222", tg_username="bob"))
+
+    assert cache.get("tg_id", "111") is None
+    assert cache.get("tg_id", "222") is not None
+
+
+@pytest.fixture
+def db():
+    STAFF_CACHE.clear()
+    yield mongomock.MongoClient().db
+    STAFF_CACHE.clear()
+
+
+def test_worker_is_read_from_database_once(db):
+    oid = db.staff.insert_one(make_record()).inserted_id
+
+    assert find_worker("tg_username", "alice", db)["_id"] == oid
+    db.staff.delete_one({"_id": oid})
+
+    # Found in cache by other key
+    assert find_worker("tg_id", "111", db)["_id"] == oid
+
+
+def test_missing_worker_is_not_cached(db):
+    assert find_worker("tg_id", "111", db) is None
+
+    oid = db.staff.insert_one(make_record()).inserted_id
+
+    assert find_worker("tg_id", "111", db)["_id"] == oid
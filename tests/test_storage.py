@@ -0,0 +1,39 @@
+"""
+Tests of choice of storage backend and restrictions of in-memory one.
+"""
+
+import pytest
+
+# Job store of reminders is installed from git (see requirements.txt)
+pytest.importorskip("ptbcontrib")
+
+import storage  # noqa: E402
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        storage.get_storage("sqlite")
+
+
+def test_memory_backend_connects_with_tasks_in_collection(monkeypatch):
+    monkeypatch.setattr(storage, "TASKS_IN_COLLECTION", True)
+    db = storage.get_storage("memory").connect()
+
+    db.projects.insert_one({"title": "Project"})
+
+    assert db.projects.count_documents({}) == 1
+
+
+def test_memory_backend_does_not_support_embedded_tasks(monkeypatch):
+    monkeypatch.setattr(storage, "TASKS_IN_COLLECTION", False)
+
+    with pytest.raises(ValueError, match="TASKS_STORAGE=collection"):
+        storage.get_storage("memory").connect()
+
+
+def test_memory_backend_without_mongomock_tells_how_to_install(monkeypatch):
+    monkeypatch.setattr(storage, "TASKS_IN_COLLECTION", True)
+    monkeypatch.setattr(storage, "mongomock", None)
+
+    with pytest.raises(ImportError, match="pip install mongomock"):
+        storage.get_storage("memory").connect()
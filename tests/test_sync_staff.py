@@ -0,0 +1,125 @@
+"""
+Tests of adding workers of imported file to staff collection:
+workers are found by telegram id or username, whichever they have.
+"""
+
+import json
+import logging
+import mongomock
+import pytest
+
+from cache import STAFF_CACHE
+from connectors import load_json
+from helpers import sync_staff
+
+
+def make_worker(**keys) -> dict:
+    worker = {"name": "Worker", "email": "", "phone": "", "tg_id": "", "tg_username": ""}
+    worker.update(keys)
+    return worker
+
+
+@pytest.fixture
+def db():
+    STAFF_CACHE.clear()
+    yield mongomock.MongoClient().db
+    STAFF_CACHE.clear()
+
+
+def test_worker_with_username_only_is_added(db):
+    staff_ids = sync_staff([make_worker(tg_username="alice")], db)
+
+    record = db.staff.find_one({"tg_username": "alice"})
+    assert staff_ids == {"alice": str(record["_id"])}
+
+
+def test_worker_with_tg_id_only_is_added(db):
+    staff_ids = sync_staff([make_worker(tg_id="111")], db)
+
+    record = db.staff.find_one({"tg_id": "111"})
+    assert staff_ids == {"111": str(record["_id"])}
+
+
+def test_worker_is_found_by_either_key(db):
+    oid = db.staff.insert_one(make_worker(tg_username="alice")).inserted_id
+
+    staff_ids = sync_staff([make_worker(tg_id="111", tg_username="alice")], db)
+
+    # Record got telegram id instead of duplicate being inserted
+    assert db.staff.count_documents({}) == 1
+    assert db.staff.find_one({"_id": oid})["tg_id"] == "111"
+    assert staff_ids == {"111": str(oid), "alice": str(oid)}
+
+
+def test_filled_fields_are_kept(db):
+    db.staff.insert_one(make_worker(tg_id="111", name="Alice", email="a@example.com"))
+
+    sync_staff([make_worker(tg_id="111", name="Somebody", phone="123")], db)
+
+    record = db.staff.find_one({"tg_id": "111"})
+    assert record["name"] == "Alice"
+    assert record["email"] == "a@example.com"
+    assert record["phone"] == "123"
+
+
+def test_workers_without_ids_are_skipped_and_reported_together(db, caplog):
+    workers = [
+        make_worker(name="Nobody"),
+        make_worker(tg_username="alice"),
+        make_worker(name="Nobody else"),
+    ]
+
+    with caplog.at_level(logging.ERROR):
+        staff_ids = sync_staff(workers, db)
+
+    assert list(staff_ids.keys()) == ["alice"]
+    assert db.staff.count_documents({}) == 1
+    assert "Skipped 2 workers" in caplog.text
+    assert "Nobody else" in caplog.text
+
+
+def write_project(path, staff: list[dict]) -> None:
+    task = {
+        "id": 1,
+        "WBS": "1",
+        "name": "Task",
+        "startdate": "2024-05-06",
+        "enddate": "2024-05-08",
+        "duration": 2,
+        "complete": 0,
+        "milestone": False,
+        "include": [],
+        "predecessors": [],
+        "successors": [],
+        "actioners": [{"actioner_id": worker["_id"]} for worker in staff],
+    }
+    path.write_text(json.dumps({"tasks": [task], "staff": staff}))
+
+
+def test_json_worker_with_tg_id_only_gets_id(db, tmp_path):
+    path = tmp_path / "project.json"
+    write_project(path, [make_worker(_id="old", tg_id="111")])
+
+    tasks = load_json(path, db)
+
+    record = db.staff.find_one({"tg_id": "111"})
+    assert tasks[0]["actioners"] == [{"actioner_id": str(record["_id"])}]
+
+
+def test_json_workers_without_ids_are_listed_together(db, tmp_path):
+    path = tmp_path / "project.json"
+    write_project(
+        path,
+        [
+            make_worker(_id="1", name="Nobody"),
+            make_worker(_id="2", tg_username="alice"),
+            make_worker(_id="3", name="Nobody else"),
+        ],
+    )
+
+    with pytest.raises(ValueError) as error:
+        load_json(path, db)
+
+    assert "Nobody'" in str(error.value)
+    assert "Nobody else" in str(error.value)
+    assert "alice" not in str(error.value)
@@ -0,0 +1,71 @@
+"""
+Tests of invalidation of pointers to active projects by change events
+which come from other instances of bot.
+"""
+
+import pytest
+
+from bson import ObjectId
+from cache import ACTIVE_PROJECT_CACHE
+from watcher import CacheWatcher
+
+PROJECT = ObjectId()
+OTHER = ObjectId()
+
+
+@pytest.fixture
+def watcher():
+    ACTIVE_PROJECT_CACHE.clear()
+    ACTIVE_PROJECT_CACHE.put("old_pm", PROJECT)
+    ACTIVE_PROJECT_CACHE.put("new_pm", OTHER)
+    yield CacheWatcher(None, "stream", 1)
+    ACTIVE_PROJECT_CACHE.clear()
+
+
+def test_deleted_project_is_forgotten(watcher):
+    watcher._apply(
+        {
+            "operationType": "delete",
+            "ns": {"coll": "projects"},
+            "documentKey": {"_id": PROJECT},
+        }
+    )
+
+    assert ACTIVE_PROJECT_CACHE.get("old_pm") is None
+    assert ACTIVE_PROJECT_CACHE.get("new_pm") == OTHER
+
+
+def test_handed_over_project_is_forgotten_by_both_pms(watcher):
+    watcher._apply(
+        {
+            "operationType": "update",
+            "ns": {"coll": "projects"},
+            "documentKey": {"_id": PROJECT},
+            "updateDescription": {"updatedFields": {"pm_tg_id": "new_pm"}},
+            "fullDocument": {"_id": PROJECT, "pm_tg_id": "new_pm", "active": True},
+        }
+    )
+
+    assert ACTIVE_PROJECT_CACHE.get("old_pm") is None
+    assert ACTIVE_PROJECT_CACHE.get("new_pm") is None
+
+
+def test_other_changes_keep_pointers(watcher):
+    watcher._apply(
+        {
+            "operationType": "update",
+            "ns": {"coll": "projects"},
+            "documentKey": {"_id": PROJECT},
+            "updateDescription": {"updatedFields": {"title": "Renamed"}},
+            "fullDocument": {"_id": PROJECT, "pm_tg_id": "old_pm", "active": True},
+        }
+    )
+
+    assert ACTIVE_PROJECT_CACHE.get("old_pm") == PROJECT
+
+
+def test_repointed_pm_is_not_dropped_by_old_project(watcher):
+    ACTIVE_PROJECT_CACHE.put("old_pm", OTHER)
+    ACTIVE_PROJECT_CACHE.invalidate_project(PROJECT)
+
+    assert ACTIVE_PROJECT_CACHE.get("old_pm") == OTHER
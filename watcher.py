@@ -0,0 +1,202 @@
+"""
+Invalidation of in-process caches (see cache.py) when several instances
+of the bot share one database. Optional, turned on by CACHE_SYNC setting:
+'off' (default) - single instance, nothing to watch;
+'stream' - change streams of 'projects' and 'staff' collections
+(need replica set or sharded cluster);
+'poll' - version counter in 'meta' collection: instance which invalidated
+its cache increments counter, others clear their caches when it changes;
+'auto' - change streams if server supports them, otherwise polling.
+Watcher runs in its own thread, because reading of change stream blocks.
+"""
+
+import logging
+import os
+import pymongo
+import threading
+
+from cache import ACTIVE_PROJECT_CACHE, STAFF_CACHE
+from dotenv import load_dotenv
+from health import DB_HEALTH
+from pymongo.database import Database
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings below could be given in .env file as well
+load_dotenv()
+
+CACHE_SYNC = os.environ.get("CACHE_SYNC", "off")
+# How often counter is polled and how long change stream waits for events (seconds)
+CACHE_SYNC_INTERVAL = float(os.environ.get("CACHE_SYNC_INTERVAL", 5))
+
+# Document in 'meta' collection which holds version counter
+VERSION_ID = "cache_version"
+# Changes of these fields of project affect cached active projects
+PROJECT_FIELDS = ("active", "pm_tg_id")
+
+
+class CacheWatcher:
+    """
+    Applies changes made by other instances of bot to caches of this one.
+    Started by start(), stopped by stop() (both called from event loop).
+    """
+
+    def __init__(self, db: Database, mode: str, interval: float) -> None:
+        self._db = db
+        self._mode = mode
+        self._interval = interval
+        self._stop = threading.Event()
+        # Set when this instance invalidated its cache and should tell others
+        self._dirty = threading.Event()
+        self._version = None
+        self._token = None
+        self._thread = threading.Thread(
+            target=self.run, name="cache-watcher", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        STAFF_CACHE.on_invalidate = None
+        ACTIVE_PROJECT_CACHE.on_invalidate = None
+
+    def notify(self) -> None:
+        """Remembers that cache was invalidated here (it's announced on next poll)"""
+        self._dirty.set()
+
+    def run(self) -> None:
+        """Body of the thread: watches change streams or polls counter until stopped"""
+
+        if self._mode in ("auto", "stream"):
+            while not self._stop.is_set():
+                try:
+                    self._watch()
+                except ConnectionFailure as e:
+                    logger.error(f"Change stream interrupted: {e}")
+                except (NotImplementedError, PyMongoError) as e:
+                    if self._mode == "stream":
+                        logger.error(f"Change stream failed: {e}")
+                    else:
+                        logger.info(f"Change streams unavailable, polling instead: {e}")
+                        break
+                # Events could be missed while stream was down
+                self._clear()
+                self._stop.wait(self._interval)
+
+        if not self._stop.is_set():
+            self._poll()
+
+    def _watch(self) -> None:
+        """Invalidates cached records changed in database (blocking)"""
+
+        pipeline = [{"$match": {"ns.coll": {"$in": ["projects", "staff"]}}}]
+        with self._db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=self._token,
+            max_await_time_ms=int(self._interval * 1000),
+        ) as stream:
+            logger.info("Watching changes of projects and staff")
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change:
+                    self._apply(change)
+                self._token = stream.resume_token
+
+    def _apply(self, change: dict) -> None:
+        """
+        Invalidates cached data affected by given change event.
+        Deleted documents come without fullDocument, so only their key is known:
+        pointers to deleted project are found by project itself. When project
+        is handed over, pointer of the old PM is dropped the same way,
+        and pointer of the new PM by fullDocument.
+        """
+
+        collection = change.get("ns", {}).get("coll")
+        operation = change.get("operationType")
+        oid = change.get("documentKey", {}).get("_id", "")
+        document = change.get("fullDocument") or {}
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self._clear()
+        elif collection == "staff":
+            STAFF_CACHE.invalidate(
+                oid=oid,
+                tg_id=document.get("tg_id", ""),
+                tg_username=document.get("tg_username", ""),
+            )
+        elif collection == "projects":
+            description = change.get("updateDescription") or {}
+            fields = list((description.get("updatedFields") or {}).keys())
+            fields += description.get("removedFields") or []
+            if operation != "update" or any(
+                field.split(".")[0] in PROJECT_FIELDS for field in fields
+            ):
+                ACTIVE_PROJECT_CACHE.invalidate_project(oid)
+                if document.get("pm_tg_id"):
+                    ACTIVE_PROJECT_CACHE.invalidate(document["pm_tg_id"])
+
+    def _poll(self) -> None:
+        """
+        Checks version counter every interval. When this instance invalidated
+        its cache, counter is incremented, and if it was changed by others
+        in between, caches are cleared.
+        """
+
+        logger.info("Polling version of caches")
+        STAFF_CACHE.on_invalidate = self.notify
+        ACTIVE_PROJECT_CACHE.on_invalidate = self.notify
+        while not self._stop.wait(self._interval):
+            if not DB_HEALTH.available:
+                continue
+            try:
+                if self._dirty.is_set():
+                    self._dirty.clear()
+                    counter = self._db.meta.find_one_and_update(
+                        {"_id": VERSION_ID},
+                        {"$inc": {"value": 1}},
+                        upsert=True,
+                        return_document=pymongo.ReturnDocument.AFTER,
+                    )
+                    expected = (self._version or 0) + 1
+                else:
+                    counter = self._db.meta.find_one({"_id": VERSION_ID})
+                    expected = self._version
+            except PyMongoError as e:
+                logger.error(f"Couldn't poll version of caches: {e}")
+                continue
+
+            version = counter["value"] if counter else 0
+            if self._version is not None and version != expected:
+                self._clear()
+            self._version = version
+
+    def _clear(self) -> None:
+        """Drops all cached data (without announcing it to other instances)"""
+
+        STAFF_CACHE.clear()
+        ACTIVE_PROJECT_CACHE.clear()
+
+
+def start_cache_watcher(
+    db: Database, mode: str = CACHE_SYNC, interval: float = CACHE_SYNC_INTERVAL
+) -> CacheWatcher | None:
+    """
+    Starts watcher of given mode (CACHE_SYNC setting by default).
+    Returns None if it's turned off.
+    Raises ValueError for unknown mode.
+    """
+
+    if mode == "off":
+        return None
+    if mode not in ("auto", "stream", "poll"):
+        raise ValueError(
+            f"Unknown CACHE_SYNC mode '{mode}', choose one of: off, auto, stream, poll"
+        )
+
+    watcher = CacheWatcher(db, mode, interval)
+    watcher.start()
+    return watcher